@@ -1,69 +1,261 @@
 import sys
 import os
-import time
 import json
+from collections import Counter
 
 from pyscbwrapper import SCB
-import matplotlib.pyplot as plt
 
+from Modules.osp_crawler import OspCrawler
+from Modules.osp_manifest import OspManifest, UNCHANGED
+from Modules.osp_table_store import OspTableStore, TABLE_STORE_DIR
+from Modules.osp_metrics import OspMetrics
+from Modules.osp_shards import OspShardMerge, shard_name
+from Modules.osp_crawl_analyzer import OspCrawlAnalyzer
+from Modules.osp_charts import compute_histogram, make_chart, render_charts
+
+ALL_TABLES_URL = 'https://data.stat.gov.lv/api/v1/lv/OSP_PUB?query=*&filter=*'
 TABLES_DIR = 'outputs/tables'
+DIAGRAM_DIR = 'outputs/table_diagrams'
+CATEGORY_CACHE_FILE = 'outputs/category_cache.json'
+MANIFEST_NAME = 'tables'
+JOURNAL_NAME = 'tables'
+EVALUATION_METRICS_NAME = 'table_metadata'
+METADATA_FIELDS = ['infofile', 'updated', 'label', 'source']
+
+class OspApiAnalyzer(OspCrawlAnalyzer):
 
-class OspApiAnalyzer:
+    manifest_name = MANIFEST_NAME
+    journal_name = JOURNAL_NAME
+    item_name = 'tables'
     
-    def __init__(self, table_limit = 150, sleep_time = 2):
-        self.tables_read = 0
-        self.table_limit = table_limit
-        self.sleep_time = sleep_time
+    def __init__(self, table_limit = 150, sleep_time = 2, concurrency = 1, requests_per_second = None, incremental = True, chart_mode = 'pdf', shard = None):
+        super().__init__(table_limit, sleep_time, concurrency, requests_per_second, incremental, chart_mode, shard)
+        self.category_cache_file = shard_name(CATEGORY_CACHE_FILE, shard)
+        self.journal = None
+        self.failed_listings = set()
     
-    def read_tables_from_api(self):
-        
-        scb = SCB('en')
-        self.categories = scb.get_data() # All 1st level categories
-
-        for i in range(len(self.categories)): # Go through all 1st level categories
-            if self.tables_read >= self.table_limit:
-                break
-            time.sleep(self.sleep_time)
-            scb = SCB('en', self.categories[i]['id'])
-            self.categories[i]['subcategories'] = scb.get_data() # POP
-
-            for j in range(len(self.categories[i]['subcategories'])): # Go through all 2nd level categories
-                if self.tables_read >= self.table_limit:
-                    break
-                time.sleep(self.sleep_time)
-                scb = SCB('en', self.categories[i]['id'], self.categories[i]['subcategories'][j]['id'])
-                self.categories[i]['subcategories'][j]['subcategories'] = scb.get_data() # POP/IR
-
-                for k in range(len(self.categories[i]['subcategories'][j]['subcategories'])):  # Go through all 3rd level categories
-                    if self.tables_read >= self.table_limit:
-                        break
-                    time.sleep(self.sleep_time)
-                    scb = SCB('en', self.categories[i]['id'], self.categories[i]['subcategories'][j]['id'], self.categories[i]['subcategories'][j]['subcategories'][k]['id'])
-                    self.categories[i]['subcategories'][j]['subcategories'][k]['subcategories'] = scb.get_data()  # POP/IR/IRE
-
-                    for m in range(len(self.categories[i]['subcategories'][j]['subcategories'][k]['subcategories'])):  # Go through all 4th level categories
-                        if self.tables_read >= self.table_limit:
-                            break
-                        time.sleep(self.sleep_time)
-
-                        # Create a unique name for the data set/table
-                        table_name = self.get_name(i, j, k, m)
-                        
-                        # Get the metadata for this data set
-                        try:
-                            scb = SCB('en', self.categories[i]['id'], self.categories[i]['subcategories'][j]['id'], self.categories[i]['subcategories'][j]['subcategories'][k]['id'], self.categories[i]['subcategories'][j]['subcategories'][k]['subcategories'][m]['id'])
-                            self.categories[i]['subcategories'][j]['subcategories'][k]['subcategories'][m]['table'] = scb.get_data()  # POP/IR/IRE/IRE010
-                        except Exception as err:
-                            print('Failed reading API response for', table_name, '. Error: ', err, 'Skipping...')
-                            continue
-
-                        # Print an update about how many tables have been processed
-                        self.tables_read += 1
-                        print('Read ', self.tables_read, '/', self.table_limit, ' tables')
-
-                        # Save the file
-                        self.save_table(i, j, k, m)
-                        
+    # Walks the category tree level by level, fetching all nodes of a level concurrently.
+    # With only_failed=True only the tables in the failure queue of the journal are downloaded again.
+    def read_tables_from_api(self, only_failed = False):
+        self.read_tables(self.read_category_tree, only_failed)
+
+    # Like read_tables_from_api, but finds the tables in the flat listing of all tables, which takes one request
+    # instead of one per category. read_tables_from_api stays available to validate the listing against the tree.
+    def read_tables_from_listing(self, only_failed = False):
+        self.read_tables(self.read_table_listing, only_failed)
+
+    # read_leaves fills in self.categories and returns the indices of all tables in it
+    def read_tables(self, read_leaves, only_failed = False):
+        self.open_crawl()
+        self.store = OspTableStore(shard_name(TABLE_STORE_DIR, self.shard))
+        self.load_category_cache()
+        self.failed_listings = set()
+        retried_listings = {key for key in self.journal.failed if key.startswith('/')}
+
+        try:
+            level = read_leaves()
+
+            level = self.select_shard(level, lambda indices: self.get_name(*indices))
+
+            # What is left are the tables (e.g. POP/IR/IRE/IRE010). Resume where the previous run stopped.
+            untried = []
+            if only_failed:
+                # The tables under a listing that failed before were never tried
+                untried = [indices for indices in level if self.get_name(*indices) not in self.journal.failed and not self.journal.is_done(self.get_name(*indices))
+                           and any(self.get_listing_key(self.get_ids(indices)[:depth]) in retried_listings for depth in range(4))]
+            leaves, complete = self.get_pending(level, lambda indices: self.get_name(*indices), only_failed, self.table_limit - self.tables_read, untried)
+
+            for indices, read in zip(leaves, self.crawler.map(self.read_table, leaves)):
+                if read == UNCHANGED:
+                    self.tables_unchanged += 1
+                    self.journal.mark_done(self.get_name(*indices))
+                    print('Unchanged table', self.get_name(*indices))
+                    continue
+                if not read:
+                    continue
+
+                # Print an update about how many tables have been processed
+                self.tables_read += 1
+                print('Read ', self.tables_read, '/', self.table_limit, ' tables (', self.crawler.describe_rate(), ')')
+
+                # Save the file
+                self.save_table(*indices)
+                self.journal.mark_done(self.get_name(*indices))
+
+            print(len(self.journal.failed), 'tables and category listings failed and can be downloaded again with only_failed=True')
+
+            # The cache and the journal only serve resuming an interrupted run, the next crawl should see fresh listings.
+            # The tables under a failed listing are unknown, so the run is not complete and the cache is kept for the retry.
+            if complete and not only_failed and not self.failed_listings:
+                if os.path.isfile(self.category_cache_file):
+                    os.remove(self.category_cache_file)
+                self.journal.finish()
+        finally:
+            if os.path.isfile(self.category_cache_file):
+                self.save_category_cache()
+            self.store.close()
+            self.close_crawl()
+
+    # Reads the category listings down to the tables and returns the indices of the tables
+    def read_category_tree(self):
+        self.categories = self.copy_listing(self.read_category_listing([])) # All 1st level categories
+
+        level = [(i,) for i in range(len(self.categories))]
+        for depth in range(1, 4): # Resolve 2nd, 3rd and 4th level categories
+            self.read_subcategories(level)
+            print('Resolved', len(level), 'categories on level', depth)
+            level = [indices + (n,) for indices in level for n in range(len(self.get_node(indices)['subcategories']))]
+        return level
+
+    # Builds the category tree from the flat listing of all tables, e.g. path /POP/IR/IRE/ and id IRE010,
+    # and returns the indices of the tables. Tables that are not three categories deep have no name and are skipped.
+    def read_table_listing(self):
+        response = self.crawler.get(ALL_TABLES_URL)
+        response.raise_for_status()
+
+        self.categories = []
+        nodes = {} # Category ids leading to a node -> node and its index among its siblings
+        level = []
+        skipped = 0
+
+        for table in response.json():
+            ids = [category_id for category_id in table['path'].split('/') if category_id]
+            if len(ids) != 3:
+                skipped += 1
+                continue
+
+            indices = ()
+            siblings = self.categories
+            for depth in range(1, 4):
+                if tuple(ids[:depth]) not in nodes:
+                    nodes[tuple(ids[:depth])] = ({'id': ids[depth - 1], 'type': 'l', 'subcategories': []}, len(siblings))
+                    siblings.append(nodes[tuple(ids[:depth])][0])
+                node, index = nodes[tuple(ids[:depth])]
+                indices += (index,)
+                siblings = node['subcategories']
+
+            siblings.append({'id': table['id'], 'type': 't', 'text': table.get('title'), 'updated': table.get('updated')})
+            level.append(indices + (len(siblings) - 1,))
+
+        print('Found', len(level), 'tables in the table listing, skipped', skipped, 'tables outside the category levels')
+        return level
+
+    # Compares the tables in the flat listing with the tables found by walking the category tree
+    def validate_table_listing(self):
+        self.crawler = OspCrawler(self.concurrency, self.requests_per_second)
+        self.journal = None # The comparison does not belong to a crawl
+        self.failed_listings = set()
+        self.load_category_cache()
+        resuming = os.path.isfile(self.category_cache_file)
+
+        try:
+            listed = {self.get_name(*indices) for indices in self.read_table_listing()}
+            walked = {self.get_name(*indices) for indices in self.read_category_tree()}
+        finally:
+            self.crawler.close()
+
+        # Leave the cache of an interrupted download alone, but do not let this walk make the next download stale
+        if not resuming:
+            os.remove(self.category_cache_file)
+
+        for table_name in sorted(walked - listed):
+            print('Only in the category tree:', table_name)
+        for table_name in sorted(listed - walked):
+            print('Only in the table listing:', table_name)
+
+        print('Compared', len(listed), 'listed tables with', len(walked), 'tables in the category tree')
+        if self.failed_listings:
+            print('Warning:', len(self.failed_listings), 'category listings failed, the tables under them are not compared')
+        return listed == walked and not self.failed_listings
+
+    def read_subcategories(self, level):
+        listings = self.crawler.map(lambda indices: self.read_category_listing(self.get_ids(indices)), level)
+        for indices, listing in zip(level, listings):
+            self.get_node(indices)['subcategories'] = self.copy_listing(listing)
+        self.save_category_cache()
+
+    # Returns the listing of a category, asking the API only if it is not cached yet. A failed listing is not
+    # cached and is recorded in the journal, so that resuming or retrying the failures requests it again.
+    def read_category_listing(self, ids):
+        key = '/'.join(ids)
+        if key in self.category_cache:
+            return self.category_cache[key]
+
+        try:
+            listing = self.crawler.call(SCB('en', *ids).get_data)
+        except Exception as err:
+            print('Failed reading category listing for', key, '. Error: ', err, 'Skipping...')
+            self.failed_listings.add(key)
+            if self.journal is not None:
+                self.journal.mark_failed(self.get_listing_key(ids), err)
+            return None
+
+        self.category_cache[key] = listing
+        if self.journal is not None and self.get_listing_key(ids) in self.journal.failed:
+            self.journal.mark_done(self.get_listing_key(ids))
+        return listing
+
+    # Journal entry of a category listing, e.g. /POP/IR. Table names never start with a slash.
+    def get_listing_key(self, ids):
+        return '/' + '/'.join(ids)
+
+    # Copies the listed nodes so that filling in the tree does not modify the cached listings
+    def copy_listing(self, listing):
+        return [dict(node) for node in listing or []]
+
+    def read_table(self, indices):
+        # Create a unique name for the data set/table
+        table_name = self.get_name(*indices)
+
+        updated = self.get_node(indices).get('updated')
+        if self.incremental and self.manifest.is_unchanged(table_name, updated) and self.store.contains(table_name):
+            return UNCHANGED
+
+        # Get the metadata for this data set
+        try:
+            table = self.crawler.call(SCB('en', *self.get_ids(indices)).get_data) # POP/IR/IRE/IRE010
+        except Exception as err:
+            print('Failed reading API response for', table_name, '. Error: ', err, 'Skipping...')
+            self.journal.mark_failed(table_name, err)
+            return False
+
+        # An error answer is not a table, it must not end up in the store
+        if not isinstance(table, dict) or not table.get('metadata'):
+            print('Failed reading API response for', table_name, '. The response has no metadata:', str(table)[:200])
+            self.journal.mark_failed(table_name, 'No metadata in the response')
+            return False
+
+        self.get_node(indices)['table'] = table
+        return True
+
+    def load_category_cache(self):
+        self.category_cache = {}
+        if os.path.isfile(self.category_cache_file):
+            with open(self.category_cache_file, 'r', encoding='utf-8') as f:
+                self.category_cache = json.load(f)
+
+    def save_category_cache(self):
+        # Write to a temporary file first so that an interrupted run does not leave a broken cache
+        temp_path = self.category_cache_file + '.tmp'
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.category_cache, f, ensure_ascii=False)
+        os.replace(temp_path, self.category_cache_file)
+
+    # Returns the category tree node at the given indices, e.g. (i, j, k, m)
+    def get_node(self, indices):
+        node = self.categories[indices[0]]
+        for index in indices[1:]:
+            node = node['subcategories'][index]
+        return node
+
+    # Returns the category ids leading to the node at the given indices
+    def get_ids(self, indices):
+        ids = [self.categories[indices[0]]['id']]
+        node = self.categories[indices[0]]
+        for index in indices[1:]:
+            node = node['subcategories'][index]
+            ids.append(node['id'])
+        return ids
 
     # Returns a unique name for the data set/table
     def get_name(self, i, j, k, m):
@@ -75,17 +267,46 @@ class OspApiAnalyzer:
     
     def save_table(self, i, j, k, m):
         table_name = self.get_name(i, j, k, m)
-        # Warn if the file is going to be rewritten
-        if os.path.isfile(TABLES_DIR + table_name):
-            print ('Warning! File ', table_name, ' already exists and will be rewritten.')
-
-        # Save the file
-        path = os.path.join(TABLES_DIR, table_name + '.json')                        
-        with open(path, 'w', encoding='utf-8') as f:
-            json.dump(self.categories[i]['subcategories'][j]['subcategories'][k]['subcategories'][m], f, indent=4, ensure_ascii=False)
+        node = self.categories[i]['subcategories'][j]['subcategories'][k]['subcategories'][m]
+        content = json.dumps(node, ensure_ascii=False)
+
+        # Only rewrite the table if it has changed since the last crawl
+        changed = self.manifest.record(table_name, '/'.join(self.get_ids((i, j, k, m))), content.encode('utf-8'), updated=node.get('updated'))
+        if not changed and self.store.contains(table_name):
+            print('Table ', table_name, ' has not changed since the last crawl.')
+            return
+
+        # Save the table
+        with self.metrics.timer('save', table=table_name):
+            self.store.put(table_name, node)
         
         print('Printed ', self.tables_read, '/', self.table_limit, ' tables (', table_name ,')')
 
+    # Combines the table stores and manifests of a crawl that ran as count shards (download_api_metadata.py
+    # --shard k/N) into the table store evaluate_metadata reads. Returns the missing tables and those downloaded more than once.
+    def merge_shards(self, count):
+        merge = OspShardMerge(MANIFEST_NAME, count)
+        merge.merge_manifests(OspManifest(MANIFEST_NAME))
+        store = OspTableStore()
+        try:
+            for shard in merge.shards:
+                directory = shard_name(TABLE_STORE_DIR, shard)
+                if not os.path.isdir(directory):
+                    continue
+                shard_store = OspTableStore(directory)
+                copied = 0
+                for table_name in merge.sources_of(shard):
+                    table = shard_store.get(table_name)
+                    if table is not None:
+                        store.put(table_name, table)
+                        copied += 1
+                shard_store.close()
+                print('Copied', copied, 'tables from shard', shard)
+            return merge.report(store.contains)
+        finally:
+            store.close()
+
+    # Loads all tables saved as separate JSON files in the old outputs/tables layout into memory
     def read_tables_from_file(self):
         self.tables = []
 
@@ -98,43 +319,77 @@ class OspApiAnalyzer:
         
         print('Read', len(self.tables), 'JSON files')
 
+    # Moves the tables from the old outputs/tables layout into the table store
+    def migrate_tables_dir(self):
+        store = OspTableStore()
+        store.import_directory(TABLES_DIR)
+        store.close()
+
+    # Yields the metadata fields needed by evaluate_metadata, from the tables loaded by read_tables_from_file
+    # or else streamed from the table store
+    def iter_metadata(self):
+        if hasattr(self, 'tables'):
+            for table in self.tables:
+                yield table["table"]["metadata"][0]
+            return
+
+        store = OspTableStore()
+        # Tables downloaded before there was a table store are moved into it on first use
+        if len(store) == 0 and os.path.isdir(TABLES_DIR):
+            print('The table store is empty, importing the tables from', TABLES_DIR)
+            store.import_directory(TABLES_DIR)
+        yield from store.iter_metadata(METADATA_FIELDS)
+        store.close()
+
+    # Only keeps counters and a histogram of label lengths, so memory does not grow with the number of tables
     def evaluate_metadata(self):
+        table_cnt = 0
         infofile_cnt = 0
         updated_cnt = 0
         label_cnt = 0
         source_cnt = 0
         sum_of_lengths = 0
-        lengths = []
+        length_counts = Counter()
 
-        for table in self.tables:
-            (infofile_present, updated_present, label_present, source_present, label_length) = self.evaluate_metadata_of_table(table)
-            infofile_cnt += 1 if infofile_present else 0
-            updated_cnt += 1 if updated_present else 0
-            label_cnt += 1 if label_present else 0
-            source_cnt += 1 if source_present else 0
-            sum_of_lengths += label_length
-            lengths.append(label_length)
+        self.metrics = OspMetrics(EVALUATION_METRICS_NAME)
+
+        # Reading the tables from the store is interleaved with evaluating them, so the loop is timed as a whole
+        with self.metrics.timer('evaluate'):
+            for metadata in self.iter_metadata():
+                (infofile_present, updated_present, label_present, source_present, label_length) = self.evaluate_metadata_fields(metadata)
+                table_cnt += 1
+                infofile_cnt += 1 if infofile_present else 0
+                updated_cnt += 1 if updated_present else 0
+                label_cnt += 1 if label_present else 0
+                source_cnt += 1 if source_present else 0
+                sum_of_lengths += label_length
+                length_counts[label_length] += 1
+
+        if table_cnt == 0:
+            print('No tables to evaluate, download them with download_api_metadata.py first')
+            self.metrics.close()
+            return
 
         print('Stats for read tables.')
-        print('Infofile field provided: ', infofile_cnt, '/', len(self.tables))
-        print('Updated field provided: ', updated_cnt, '/', len(self.tables))
-        print('Label field provided: ', label_cnt, '/', len(self.tables))
-        print('Source field provided: ', source_cnt, '/', len(self.tables))
-        print('Average label length: ', sum_of_lengths / len(self.tables))
-
-        max_length = max(lengths)
-        step = max(max_length // 10, 1)
-        plt.hist(lengths, bins=range(0, max_length + step, step), edgecolor='black', alpha=0.7)
-        plt.xlim(0, max_length + step)
-        plt.title('Lauka "label" kā simbolu virknes garums')
-        plt.xlabel('Lauka garums')
-        plt.ylabel('Lauku skaits')
-        plt.show()
+        print('Infofile field provided: ', infofile_cnt, '/', table_cnt)
+        print('Updated field provided: ', updated_cnt, '/', table_cnt)
+        print('Label field provided: ', label_cnt, '/', table_cnt)
+        print('Source field provided: ', source_cnt, '/', table_cnt)
+        print('Average label length: ', sum_of_lengths / table_cnt)
+
+        # Saved instead of shown, so that the evaluation also runs without a display
+        counts, edges, max_x = compute_histogram(list(length_counts.keys()), 10, weights=list(length_counts.values()))
+        chart = make_chart(os.path.join(DIAGRAM_DIR, 'labels.pdf'), 'Lauka "label" kā simbolu virknes garums', 'Lauka garums', 'Lauku skaits', counts, edges, (0, max_x), grid=False, integer_ticks=False)
+        with self.metrics.timer('render'):
+            render_charts([chart], self.chart_mode, DIAGRAM_DIR, 'labels')
+        self.metrics.count('tables', table_cnt)
+        self.metrics.close()
 
     def evaluate_metadata_of_table(self, table):
         # Extract the metadata from the table
-        metadata = table["table"]["metadata"][0]
+        return self.evaluate_metadata_fields(table["table"]["metadata"][0])
 
+    def evaluate_metadata_fields(self, metadata):
         # Check if each metadata field is present and not empty
         infofile_present = "infofile" in metadata and metadata["infofile"]
         updated_present = "updated" in metadata and metadata["updated"]
@@ -0,0 +1,91 @@
+import os
+import csv
+import json
+
+import numpy as np
+import matplotlib
+matplotlib.use('Agg') # Render to files only, the batch nodes have no display
+from matplotlib.figure import Figure
+from matplotlib.backends.backend_pdf import PdfPages
+
+from Modules.osp_parallel import parallel_map
+
+CHART_MODES = ('pdf', 'multipage', 'data') # One PDF per chart, all charts in one PDF, or only the histogram data
+
+# Histogram with bins of equal width starting at 0, like plt.hist(values, bins=range(0, max + step, step))
+def compute_histogram(values, bins_per_chart, weights = None):
+    values = np.asarray(values)
+    max_length = int(values.max())
+    step = max(max_length // bins_per_chart, 1)
+    counts, edges = np.histogram(values, bins=np.arange(0, max_length + step, step), weights=weights)
+    return counts, edges, max_length + step
+
+# Describes one chart. The histogram is computed once here, the workers only draw it.
+def make_chart(path, title, xlabel, ylabel, counts, edges, xlim, grid = True, integer_ticks = True):
+    return {
+        'path': path,
+        'title': title,
+        'xlabel': xlabel,
+        'ylabel': ylabel,
+        'counts': counts,
+        'edges': edges,
+        'xlim': xlim,
+        'grid': grid,
+        'integer_ticks': integer_ticks,
+    }
+
+# Draws a chart on its own Figure, without the global pyplot state
+def draw_chart(chart):
+    figure = Figure()
+    axes = figure.subplots()
+    axes.hist(chart['edges'][:-1], bins=chart['edges'], weights=chart['counts'], edgecolor='black', alpha=0.7)
+    axes.set_title(chart['title'])
+    axes.set_xlabel(chart['xlabel'])
+    axes.set_ylabel(chart['ylabel'])
+    if chart['grid']:
+        axes.grid(True, axis='y')
+    if chart['integer_ticks']:
+        x_ticks = axes.get_xticks()
+        axes.set_xticks(x_ticks, [int(tick) if tick.is_integer() else '' for tick in x_ticks])
+    axes.set_xlim(*chart['xlim'])
+    figure.tight_layout()
+    return figure
+
+# Runs in a worker process
+def render_chart(chart):
+    draw_chart(chart).savefig(chart['path'], format='pdf')
+    return chart['path']
+
+# Writes the charts as separate PDFs (rendered in parallel), as one multi-page PDF, or only their histogram data.
+# name is the file name without extension used by the multipage and data modes.
+def render_charts(charts, mode = 'pdf', output_dir = '.', name = 'charts', workers = None):
+    if mode not in CHART_MODES:
+        raise ValueError('Unknown chart mode ' + str(mode) + ', expected one of ' + ', '.join(CHART_MODES))
+    if not charts:
+        return
+
+    os.makedirs(output_dir, exist_ok=True)
+
+    if mode == 'pdf':
+        workers = 1 if len(charts) == 1 else workers
+        for path in parallel_map(render_chart, charts, workers):
+            pass
+    elif mode == 'multipage':
+        with PdfPages(os.path.join(output_dir, name + '.pdf')) as pdf:
+            for chart in charts:
+                pdf.savefig(draw_chart(chart))
+    else:
+        write_histogram_data(charts, output_dir, name)
+
+def write_histogram_data(charts, output_dir, name):
+    data = {chart['title']: {'edges': np.asarray(chart['edges']).tolist(), 'counts': np.asarray(chart['counts']).tolist()} for chart in charts}
+    with open(os.path.join(output_dir, name + '.json'), 'w', encoding='utf-8') as f:
+        json.dump(data, f, indent=4, ensure_ascii=False)
+
+    with open(os.path.join(output_dir, name + '.csv'), 'w', encoding='utf-8', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(['chart', 'bin_start', 'bin_end', 'count'])
+        for title, histogram in data.items():
+            edges = histogram['edges']
+            for i, count in enumerate(histogram['counts']):
+                writer.writerow([title, edges[i], edges[i + 1], count])
@@ -0,0 +1,29 @@
+import argparse
+
+from Modules.osp_page_store import STORAGE_MODES, DEFAULT_STORAGE
+from Modules.osp_shards import parse_shard
+
+def shard_argument(value):
+    try:
+        return parse_shard(value)
+    except ValueError as err:
+        raise argparse.ArgumentTypeError(str(err))
+
+# Command line options shared by the download_*.py scripts. The options about saving and parsing the pages
+# are only offered by the scripts that download pages (pages=True), not by the API download.
+def parse_download_args(description, pages = True):
+    parser = argparse.ArgumentParser(description=description)
+    parser.add_argument('--retry-failed', action='store_true', help='only download the data sets in the failure queue of the previous crawl')
+    parser.add_argument('--shard', type=shard_argument, default=None, metavar='k/N', help='only download shard k of N of the data sets, combine the shards with merge_shards.py')
+    if not pages:
+        return parser.parse_args()
+
+    parser.add_argument('--analyze', action='store_true', help='parse the pages while they are downloaded and generate the reports at the end')
+    parser.add_argument('--keep-html', action='store_true', help='with --analyze, also save the downloaded HTML pages')
+    parser.add_argument('--storage', choices=STORAGE_MODES, default=DEFAULT_STORAGE, help='save the pages as loose .html files or in a compressed pack file (default from OSP_PAGE_STORAGE)')
+    args = parser.parse_args()
+
+    # The reports of one shard would only cover its part of the data sets
+    if args.shard is not None and args.analyze:
+        parser.error('--analyze cannot be used with --shard, analyze the merged corpus instead')
+    return args
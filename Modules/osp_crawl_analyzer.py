@@ -0,0 +1,175 @@
+from Modules.osp_crawler import OspCrawler
+from Modules.osp_manifest import OspManifest, UNCHANGED
+from Modules.osp_journal import OspJournal
+from Modules.osp_extraction_cache import decode_text
+from Modules.osp_page_store import DEFAULT_STORAGE, open_page_store, merge_shard_packs
+from Modules.osp_pipeline import OspPipeline
+from Modules.osp_metrics import OspMetrics
+from Modules.osp_shards import OspShardMerge, shard_name
+
+# What the analyzers that crawl share: the crawl settings, the metrics, crawler, manifest and journal of a crawl
+# (of the analyzer's shard), picking the shard's items and resuming where the previous run stopped.
+# Subclasses set the names of their manifest and journal and what they call the items they download.
+class OspCrawlAnalyzer:
+
+    manifest_name = None
+    journal_name = None
+    item_name = 'data sets'
+
+    def __init__(self, table_limit, sleep_time, concurrency, requests_per_second, incremental, chart_mode, shard):
+        self.tables_read = 0
+        self.tables_unchanged = 0
+        self.table_limit = table_limit
+        self.sleep_time = sleep_time
+        self.concurrency = concurrency
+        # Without an explicit cap keep the old pace of one request per sleep_time
+        if requests_per_second is None and sleep_time:
+            requests_per_second = 1 / sleep_time
+        self.requests_per_second = requests_per_second
+        self.incremental = incremental # Skip what has not changed since the last crawl
+        self.chart_mode = chart_mode # 'pdf', 'multipage' or 'data', see osp_charts
+        self.shard = shard # Only download this shard's items, see osp_shards and merge_shards
+
+    def open_crawl(self):
+        self.metrics = OspMetrics(shard_name(self.manifest_name, self.shard))
+        self.crawler = OspCrawler(self.concurrency, self.requests_per_second, metrics=self.metrics)
+        self.manifest = OspManifest(shard_name(self.manifest_name, self.shard))
+        self.journal = OspJournal(shard_name(self.journal_name, self.shard))
+
+    def close_crawl(self):
+        self.manifest.save()
+        self.journal.close()
+        self.crawler.close()
+        self.metrics.close()
+
+    # Every shard reads the listings, but only downloads the items that hash to it. The assignment is saved
+    # so that the merge can tell which items are missing.
+    def select_shard(self, items, get_dataset):
+        if self.shard is None:
+            return items
+        selected = self.shard.select(items, get_dataset)
+        self.shard.save_assignment(self.manifest_name, [get_dataset(item) for item in selected], len(items))
+        print('Shard', self.shard, 'has', len(selected), 'of', len(items), self.item_name)
+        return selected
+
+    # Resumes where the previous run stopped. Returns up to limit of the items the journal does not have as done
+    # (only the failed ones with only_failed) followed by the extra items to crawl anyway, and whether these are all that are left.
+    def get_pending(self, items, get_dataset, only_failed, limit, extra = ()):
+        pending = self.journal.pending(items, get_dataset, only_failed) + list(extra)
+        print('Skipping', len(items) - len(pending), self.item_name, 'already handled by a previous run')
+        return pending[:max(limit, 0)], len(pending) <= limit
+
+# An analyzer that downloads one HTML page per data set of the table listing into a page store, and can
+# parse the pages while they are downloaded. Subclasses set the directories of the store and provide
+# report_pipeline_results for the parsed pages.
+class OspPageAnalyzer(OspCrawlAnalyzer):
+
+    html_dir = None
+    pack_dir = None
+
+    def __init__(self, table_limit = 3, sleep_time = 2, concurrency = 1, requests_per_second = None, incremental = True, chart_mode = 'pdf', storage = DEFAULT_STORAGE, shard = None):
+        super().__init__(table_limit, sleep_time, concurrency, requests_per_second, incremental, chart_mode, shard)
+        self.storage = storage # 'files' or 'pack', see osp_page_store
+
+    # Downloads the pages of the data sets in the listing at listing_url with download, which returns True if the
+    # page was saved, UNCHANGED if the saved copy is still current and False on failure.
+    # With only_failed=True only the data sets in the failure queue of the journal are downloaded again.
+    # With analyze=True the pages are parsed with parse_text in a pipeline while they are downloaded. The HTML
+    # is then only saved if keep_html is True or a saved copy already exists.
+    def crawl_pages(self, listing_url, download, parse_text, only_failed = False, analyze = False, keep_html = False, workers = None):
+        self.open_crawl()
+        self.pipeline = OspPipeline(parse_text, workers) if analyze else None
+        self.keep_html = keep_html or not analyze
+        self.pages = open_page_store(self.storage, self.html_dir, shard_name(self.pack_dir, self.shard))
+
+        try:
+            response = self.crawler.get(listing_url)
+            if response.status_code != 200:
+                print('Error:', response.status_code)
+                return
+
+            self.tables = self.select_shard(response.json(), self.get_dataset_filename)
+            # An earlier run with analyze=True parsed pages without saving them, the report needs them again
+            unsaved = []
+            if self.pipeline is not None and not only_failed:
+                unsaved = [table for table in self.tables if self.journal.is_done(self.get_dataset_filename(table)) and not self.pages.contains(self.get_dataset_filename(table))]
+            tables, complete = self.get_pending(self.tables, self.get_dataset_filename, only_failed, self.table_limit, unsaved)
+
+            for table, result in zip(tables, self.crawler.map(download, tables)):
+                if result == UNCHANGED:
+                    self.tables_unchanged += 1
+                elif result:
+                    self.tables_read += 1
+                else:
+                    continue
+                self.journal.mark_done(self.get_dataset_filename(table))
+                print('Saved HTML file ', self.tables_read, '/', len(tables), '(', self.tables_unchanged, 'unchanged, at', self.crawler.describe_rate(), '):', self.get_dataset_filename(table), end='\r')
+
+            print()
+            print(len(self.journal.failed), 'data sets failed and can be downloaded again with only_failed=True')
+            if complete and not only_failed:
+                self.journal.finish()
+
+            if self.pipeline is not None:
+                self.analyze_pipeline_results(workers)
+        finally:
+            self.pages.close()
+            if self.pipeline is not None:
+                self.pipeline.close()
+            self.close_crawl()
+
+    # Hands a downloaded page to the pipeline and saves it. Returns True if the page was saved and UNCHANGED
+    # if the saved copy is still current.
+    def store_page(self, filename, url, response, updated = None):
+        if self.pipeline is not None:
+            self.pipeline.submit(filename, self.get_pipeline_task(decode_text(response.content)))
+
+        changed = self.manifest.record(filename, url, response.content, response.headers, updated)
+        saved = self.pages.contains(filename)
+        if not changed and saved:
+            return UNCHANGED
+
+        # A saved copy is always kept up to date, so that later incremental runs can rely on it
+        if self.keep_html or saved:
+            self.pages.put(filename, response.content)
+        return True
+
+    # What the pipeline parses of a page
+    def get_pipeline_task(self, text):
+        return text
+
+    # Reports the pages parsed during the crawl. Pages that were not downloaded in this run (unchanged,
+    # or done by an earlier run) are parsed from their saved copy.
+    def analyze_pipeline_results(self, workers = None):
+        saved = [self.get_dataset_filename(table) for table in self.tables]
+        saved = [filename for filename in saved if filename not in self.pipeline and self.pages.contains(filename)]
+        for filename in self.pages.in_read_order(saved):
+            self.pipeline.submit(filename, self.get_pipeline_task(self.pages.read(filename)))
+
+        files, results = self.pipeline.results()
+        if len(files) < len(self.tables):
+            print('Warning:', len(self.tables) - len(files), 'data sets are missing from the report, their pages were neither downloaded nor saved')
+        for filename, (result, file_hash, timings) in zip(files, results):
+            self.metrics.record_file(filename, timings)
+        self.report_pipeline_results(files, [result for result, file_hash, timings in results], workers)
+
+    def get_url_ending(self, table):
+        url_ending = table['path'][1:]
+        url_ending = url_ending.replace('/', '__')
+        url_ending += '/' + table['id']
+        return url_ending
+
+    def get_dataset_filename(self, table):
+        return self.get_url_ending(table).replace('/', '__') + '.html'
+
+    # Combines the pages and manifests of a crawl that ran as count shards (--shard k/N) into the corpus
+    # the analyses read. Returns the missing data sets and those downloaded more than once.
+    def merge_shards(self, count):
+        merge = OspShardMerge(self.manifest_name, count)
+        self.pages = open_page_store(self.storage, self.html_dir, self.pack_dir)
+        try:
+            merge.merge_manifests(OspManifest(self.manifest_name))
+            merge_shard_packs(merge, self.pages, self.pack_dir)
+            return merge.report(self.pages.contains)
+        finally:
+            self.pages.close()
@@ -0,0 +1,228 @@
+import threading
+import time
+import random
+from email.utils import parsedate_to_datetime
+from datetime import datetime, timezone
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from requests.adapters import HTTPAdapter
+
+REQUEST_TIMEOUT = 30
+MAX_RETRIES = 4
+BACKOFF_BASE = 1
+BACKOFF_MAX = 60
+RETRY_STATUS_CODES = (429, 500, 502, 503, 504)
+RETRY_AFTER_MAX = 600
+SLOW_RESPONSE_TIME = 5 # Seconds after which a response counts as a sign of an overloaded server
+RATE_INCREASE = 0.05 # Requests per second added after every healthy response
+RATE_DECREASE = 0.5 # Factor applied to the rate after an error or a slow response
+MAX_RATE_FACTOR = 4 # The adaptive rate grows up to this multiple of the initial rate
+DECREASE_COOLDOWN = 1 # Seconds in which further errors do not cut the rate again, so that one burst counts once
+
+# Spaces out requests so that all worker threads together stay under a global requests-per-second cap
+class RateLimiter:
+
+    def __init__(self, requests_per_second = None):
+        self.rate = requests_per_second or None
+        self.interval = 1 / requests_per_second if requests_per_second else 0
+        self.next_slot = time.monotonic()
+        self.lock = threading.Lock()
+
+    # Blocks until the caller may send its request. Returns the time spent waiting.
+    def wait(self):
+        with self.lock:
+            now = time.monotonic()
+            slot = max(now, self.next_slot)
+            self.next_slot = slot + self.interval
+
+        delay = slot - now
+        if delay > 0:
+            time.sleep(delay)
+        return delay
+
+    # Holds back all requests for the given number of seconds, e.g. as asked by a Retry-After header
+    def pause(self, seconds):
+        with self.lock:
+            self.next_slot = max(self.next_slot, time.monotonic() + seconds)
+
+    # The fixed limiter ignores how the server responds
+    def on_success(self):
+        return None
+
+    def on_error(self):
+        return None
+
+    def describe(self):
+        return 'unlimited' if self.rate is None else str(round(self.rate, 2)) + ' requests/s'
+
+# Adjusts the rate to the server (AIMD): every healthy response raises it a little, an error or a slow response
+# halves it. The rate stays between min_rate and max_rate.
+class AdaptiveRateLimiter(RateLimiter):
+
+    def __init__(self, requests_per_second, max_rate = None, min_rate = None):
+        super().__init__(requests_per_second)
+        self.max_rate = max_rate or requests_per_second * MAX_RATE_FACTOR
+        self.min_rate = min_rate or requests_per_second / MAX_RATE_FACTOR
+        self.last_decrease = 0
+
+    def set_rate(self, rate):
+        self.rate = rate
+        self.interval = 1 / rate
+
+    # Returns the new rate if it changed
+    def on_success(self):
+        with self.lock:
+            if self.rate >= self.max_rate:
+                return None
+            self.set_rate(min(self.rate + RATE_INCREASE, self.max_rate))
+            return self.rate
+
+    def on_error(self):
+        with self.lock:
+            now = time.monotonic()
+            if now - self.last_decrease < DECREASE_COOLDOWN or self.rate <= self.min_rate:
+                return None
+            self.last_decrease = now
+            self.set_rate(max(self.rate * RATE_DECREASE, self.min_rate))
+            return self.rate
+
+# Returns the delay in seconds asked for by a Retry-After header (seconds or an HTTP date), or None
+def parse_retry_after(value):
+    if not value:
+        return None
+    try:
+        seconds = float(value)
+    except ValueError:
+        try:
+            seconds = (parsedate_to_datetime(value) - datetime.now(timezone.utc)).total_seconds()
+        except (TypeError, ValueError):
+            return None
+    return min(max(seconds, 0), RETRY_AFTER_MAX)
+
+# Fetches pages concurrently through one pooled HTTP session
+class OspCrawler:
+
+    # With adaptive=True requests_per_second is only the initial rate, which then follows the server's responses
+    # up to max_requests_per_second. With an OspMetrics object every request, retry and wait for the rate limit is recorded in it.
+    def __init__(self, concurrency = 8, requests_per_second = 4, timeout = REQUEST_TIMEOUT, max_retries = MAX_RETRIES, metrics = None, adaptive = True, max_requests_per_second = None):
+        self.concurrency = max(concurrency, 1)
+        self.timeout = timeout
+        self.max_retries = max_retries
+        # Without an initial rate there is nothing to adapt, only Retry-After is honored
+        if adaptive and requests_per_second:
+            self.rate_limiter = AdaptiveRateLimiter(requests_per_second, max_requests_per_second)
+        else:
+            self.rate_limiter = RateLimiter(requests_per_second)
+        self.metrics = metrics
+
+        # Keep one connection per worker alive instead of reconnecting for every request
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=self.concurrency, pool_maxsize=self.concurrency)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+
+    # Retries connection errors, timeouts and temporary server errors. After the last retry the response
+    # is returned as it is, or the error is raised.
+    def get(self, url, **kwargs):
+        kwargs.setdefault('timeout', self.timeout)
+
+        for attempt in range(self.max_retries + 1):
+            self.wait()
+            start = time.perf_counter()
+            try:
+                response = self.session.get(url, **kwargs)
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as err:
+                self.record_request(url, start, error=err)
+                self.adapt_rate(False, err)
+                if attempt == self.max_retries:
+                    raise
+                self.backoff(attempt, url, err)
+                continue
+            seconds = self.record_request(url, start, response.status_code, len(response.content))
+
+            if response.status_code in RETRY_STATUS_CODES:
+                self.adapt_rate(False, 'HTTP ' + str(response.status_code))
+            else:
+                self.adapt_rate(seconds < SLOW_RESPONSE_TIME, 'slow response')
+
+            if response.status_code not in RETRY_STATUS_CODES or attempt == self.max_retries:
+                return response
+            self.backoff(attempt, url, 'HTTP ' + str(response.status_code), parse_retry_after(response.headers.get('Retry-After')))
+
+    # Calls func with the same rate limit and retries as get(), for requests not made through the session
+    def call(self, func, *args, **kwargs):
+        target = getattr(func, '__qualname__', func)
+        for attempt in range(self.max_retries + 1):
+            self.wait()
+            start = time.perf_counter()
+            try:
+                result = func(*args, **kwargs)
+            except Exception as err:
+                self.record_request(target, start, error=err)
+                self.adapt_rate(False, err)
+                if attempt == self.max_retries:
+                    raise
+                self.backoff(attempt, target, err)
+                continue
+            seconds = self.record_request(target, start)
+            self.adapt_rate(seconds < SLOW_RESPONSE_TIME, 'slow response')
+            return result
+
+    def wait(self):
+        delay = self.rate_limiter.wait()
+        if self.metrics is not None:
+            self.metrics.observe('rate_limit_wait', delay)
+
+    # Raises the rate after a healthy response and lowers it after a failed or slow one
+    def adapt_rate(self, healthy, reason):
+        rate = self.rate_limiter.on_success() if healthy else self.rate_limiter.on_error()
+        if rate is not None and self.metrics is not None:
+            self.metrics.event('rate', rate=rate, reason=None if healthy else str(reason))
+        if rate is not None and not healthy:
+            print('Slowing down to', self.rate_limiter.describe(), '(', reason, ')')
+
+    def describe_rate(self):
+        return self.rate_limiter.describe()
+
+    # Returns the duration of the request
+    def record_request(self, target, start, status = None, size = None, error = None):
+        seconds = time.perf_counter() - start
+        if self.metrics is None:
+            return seconds
+        self.metrics.observe('request', seconds)
+        self.metrics.count('requests')
+        if size is not None:
+            self.metrics.count('bytes', size)
+        if error is not None:
+            self.metrics.count('request_errors')
+        self.metrics.event('request', target=str(target), status=status, bytes=size, seconds=seconds, error=None if error is None else str(error))
+        return seconds
+
+    # Waits an exponentially growing, jittered time before the next attempt, or as long as the server asked
+    # in its Retry-After header. In that case the other worker threads hold back as well.
+    def backoff(self, attempt, target, reason, retry_after = None):
+        if retry_after is not None:
+            delay = retry_after
+            self.rate_limiter.pause(delay)
+        else:
+            delay = min(BACKOFF_BASE * 2 ** attempt, BACKOFF_MAX) * random.uniform(0.5, 1)
+        print('Retrying', target, 'in', round(delay, 1), 's (', reason, ')')
+        if self.metrics is not None:
+            self.metrics.count('retries')
+            self.metrics.observe('retry_wait', delay)
+            self.metrics.event('retry', target=str(target), attempt=attempt, delay=delay, reason=str(reason))
+        time.sleep(delay)
+
+    # Applies func to every item using the worker pool. Results are yielded in the order of items.
+    def map(self, func, items):
+        if self.concurrency == 1:
+            for item in items:
+                yield func(item)
+            return
+
+        with ThreadPoolExecutor(max_workers=self.concurrency) as executor:
+            yield from executor.map(func, items)
+
+    def close(self):
+        self.session.close()
@@ -1,99 +1,167 @@
 import os
-import sys
-import requests
 import time
+import requests
 from datetime import datetime, date
+from html.parser import HTMLParser
 
 from bs4 import BeautifulSoup
-import matplotlib.pyplot as plt
+import numpy as np
+
+from Modules.osp_manifest import OspManifest, UNCHANGED
+from Modules.osp_parallel import parallel_map
+from Modules.osp_charts import make_chart, render_charts
+from Modules.osp_extraction_cache import OspExtractionCache, content_hash
+from Modules.osp_page_store import open_page_store, read_page
+from Modules.osp_metrics import OspMetrics
+from Modules.osp_crawl_analyzer import OspPageAnalyzer
+from Modules.osp_freshness import OspFreshnessIndex
 
 ALL_TABLES_URL = 'https://data.stat.gov.lv/api/v1/lv/OSP_PUB?query=*&filter=*'
 TABLE_URL_BASE = 'https://data.stat.gov.lv/pxweb/lv/OSP_PUB/START__'
 DATASET_HTML_DIR = 'outputs/dataset_pages'
+DATASET_PACK_DIR = 'outputs/dataset_pages_pack'
 DIAGRAM_DIR = 'outputs/dataset_diagrams'
 EMPTY_FIELD_LOG = 'empty_fields.txt'
 LIST_FILE = 'list.txt'
+PARSE_CHUNK_SIZE = 16384
+EXTRACTION_CACHE_KIND = 'dataset_dates'
+MANIFEST_NAME = 'dataset_pages'
+JOURNAL_NAME = 'dataset_pages'
 
-class OspDateAnalyzer:
+class OspDateAnalyzer(OspPageAnalyzer):
 
-    def __init__(self, table_limit = 3, sleep_time = 2):
-        self.tables_read = 0
-        self.table_limit = table_limit
-        self.sleep_time = sleep_time
+    manifest_name = MANIFEST_NAME
+    journal_name = JOURNAL_NAME
+    html_dir = DATASET_HTML_DIR
+    pack_dir = DATASET_PACK_DIR
 
-    def read_date_pages(self):
-        response = requests.get(ALL_TABLES_URL)
-
-        if response.status_code != 200:
-            print('Error:', response.status_code)
-            return
-        self.tables = response.json()
+    # With only_failed=True only the data sets in the failure queue of the journal are downloaded again.
+    # With analyze=True the pages are parsed while they are downloaded and the list and chart are generated
+    # when the crawl ends. The HTML is then only saved if keep_html is True or a saved copy already exists.
+    def read_date_pages(self, only_failed = False, analyze = False, keep_html = False, workers = None):
+        self.crawl_pages(ALL_TABLES_URL, self.download_table, extract_date_from_text, only_failed, analyze, keep_html, workers)
 
-        for i in range(len(self.tables)):
-            if i >= self.table_limit:
-                break
+    # Generates the list and the chart from the dates parsed during the crawl
+    def report_pipeline_results(self, files, update_dates, workers = None):
+        self.report_dates(files, update_dates)
 
-            time.sleep(self.sleep_time)
+    def download_table(self, table):
+        return self.download_dataset_page(self.get_url_ending(table), table.get('updated'))
 
-            url_ending = self.tables[i]['path'][1:]
-            url_ending = url_ending.replace('/', '__')
-            url_ending += '/' + self.tables[i]['id']
+    # Returns True if the page was saved, UNCHANGED if the saved copy is still current and False on failure
+    def download_dataset_page(self, url_ending, updated = None):
+        dataset_filename = url_ending.replace('/', '__') + '.html'
+        url = TABLE_URL_BASE + url_ending
 
-            self.download_dataset_page(url_ending)
-            print('Saved metadata HTML file ', i+1, '/', min(self.table_limit, len(self.tables)), ': ', url_ending.replace('/', '__') + '.html', end='\r')
+        headers = {}
+        if self.incremental and self.pages.contains(dataset_filename):
+            if self.manifest.is_unchanged(dataset_filename, updated):
+                return UNCHANGED
+            headers = self.manifest.conditional_headers(dataset_filename, url)
 
-    def download_dataset_page(self, url_ending):
         try:
-            dataset_response = requests.get(TABLE_URL_BASE + url_ending)
-            requestSuccessful = True
-        except requests.exceptions as errh:
+            dataset_response = self.crawler.get(url, headers=headers)
+        except requests.exceptions.RequestException as errh:
             print('Failed reading the table page: ', errh)
+            self.journal.mark_failed(dataset_filename, errh)
             return False
-        
-        dataset_filename = url_ending.replace('/', '__') + '.html'
-        path = os.path.join(DATASET_HTML_DIR, dataset_filename)
-        with open(path, 'wb') as f:
-            f.write(dataset_response.content)
-        return True
 
-    def analyze_date_data(self):
+        if dataset_response.status_code == 304:
+            self.manifest.touch(dataset_filename, updated)
+            return UNCHANGED
+
+        if dataset_response.status_code != 200:
+            print('Failed reading the table page: ', url, 'returned', dataset_response.status_code)
+            self.journal.mark_failed(dataset_filename, 'HTTP ' + str(dataset_response.status_code))
+            return False
+
+        return self.store_page(dataset_filename, url, dataset_response, updated)
+
+    # Parses the data set pages in a pool of worker processes. workers defaults to the number of cores.
+    # Unchanged pages are loaded from the extraction cache unless use_cache is False.
+    def analyze_date_data(self, workers = None, use_cache = True):
+        self.pages = open_page_store(self.storage, DATASET_HTML_DIR, DATASET_PACK_DIR)
+        files = self.pages.names()
 
+        self.metrics = OspMetrics(EXTRACTION_CACHE_KIND)
+        self.manifest = OspManifest(MANIFEST_NAME) # For the crawl times in the freshness index
         try:
-            os.remove(os.path.join(DIAGRAM_DIR, EMPTY_FIELD_LOG))
-        except:
-            pass
+            update_dates = self.extract_dates(files, workers, use_cache)
+            self.report_dates(files, update_dates, self.changed_files, whole_corpus=True)
+        finally:
+            self.metrics.close()
+            self.pages.close()
+
+    # Adds a snapshot of the last update date of every file to the freshness index, and writes the list of weeks
+    # since the last update and the chart from it. Only the changed_files (all files if None) and the files the
+    # index does not know yet are compared with the index. Only if files are the whole_corpus, the data sets
+    # the index knows but files lack are recorded as removed. A crawl may have read only part of the corpus.
+    def report_dates(self, files, update_dates, changed_files = None, whole_corpus = False):
+        freshness = OspFreshnessIndex()
+        try:
+            known = freshness.datasets()
+            changed_files = set(files if changed_files is None else changed_files)
+            observed = {filename: update_date for filename, update_date in zip(files, update_dates) if filename in changed_files or filename not in known}
+            crawl_times = {filename: (self.manifest.get(filename) or {}).get('fetched_at') for filename in observed}
+            with self.metrics.timer('index', observed=len(observed)):
+                freshness.update(observed, files if whole_corpus else None, crawl_times)
+
+            try:
+                os.remove(os.path.join(DIAGRAM_DIR, EMPTY_FIELD_LOG))
+            except:
+                pass
 
-        date_data = []
-        filenames = []
+            undated = freshness.undated()
+            if undated:
+                with open(os.path.join(DIAGRAM_DIR, EMPTY_FIELD_LOG), 'w', encoding='utf-8') as f:
+                    for filename in undated:
+                        print('No updated field for', filename, file=f)
 
-        files = os.listdir(DATASET_HTML_DIR)
-        
-        total_working_pages = 0
+            self.generate_list(freshness)
+            with self.metrics.timer('render'):
+                self.generate_charts(freshness)
+        finally:
+            freshness.close()
+
+    # Returns the last update date of every file in files. With use_cache only new and changed files are parsed,
+    # they are left in self.changed_files.
+    def extract_dates(self, files, workers = None, use_cache = True):
+        self.changed_files = files
+        if not use_cache:
+            extracted = {}
+            ordered_files = self.pages.in_read_order(files)
+            refs = [self.pages.ref(filename) for filename in ordered_files]
+            for filename, (update_date, file_hash, timings) in zip(ordered_files, parallel_map(extract_date_features, refs, workers)):
+                self.metrics.record_file(filename, timings)
+                extracted[filename] = update_date
+            return [extracted[filename] for filename in files]
+
+        cache = OspExtractionCache(EXTRACTION_CACHE_KIND)
+        extracted = {}
 
         for filename in files:
-            if filename.endswith('.html'):
-                file_path = os.path.join(DATASET_HTML_DIR, filename)
-                with open(file_path, 'r', encoding='utf-8') as f:
-                    total_working_pages += 1
-                    dataset_page = BeautifulSoup(f.read(), 'html.parser')
-
-                    update_date = self.extract_date(dataset_page)
-                    
-                    if update_date != None:
-                        days_from_today = (date.today()-update_date).days
-                        date_data.append(days_from_today // 7)
-                        filenames.append(filename)
-                    else:
-                        with open(os.path.join(DIAGRAM_DIR, EMPTY_FIELD_LOG), 'a', encoding='utf-8') as f:
-                            original_stdout = sys.stdout
-                            sys.stdout = f 
-                            print ('No updated field for', filename)
-                            sys.stdout = original_stdout
-
-                    print('Processed', len(filenames), '/', len(files), 'HTML metadata files', end='\r')
-        
-        self.generate_list(zip(date_data, filenames))
-        self.generate_charts(date_data)
+            features = self.pages.cache_lookup(cache, filename)
+            if features is not None:
+                extracted[filename] = date.fromisoformat(features['date']) if features['date'] else None
+
+        changed_files = [filename for filename in files if filename not in extracted]
+        self.changed_files = changed_files
+        print('Loaded', len(extracted), 'HTML files from the extraction cache, parsing', len(changed_files))
+        self.metrics.count('cache_hits', len(extracted))
+
+        # Parsed in the order of the pack file, the results are returned in the order of files
+        ordered_files = self.pages.in_read_order(changed_files)
+        refs = [self.pages.ref(filename) for filename in ordered_files]
+        for filename, (update_date, file_hash, timings) in zip(ordered_files, parallel_map(extract_date_features, refs, workers)):
+            self.metrics.record_file(filename, timings)
+            extracted[filename] = update_date
+            # A missing date is cached too, it is the "no updated field" case
+            self.pages.cache_store(cache, filename, file_hash, {'date': update_date.isoformat() if update_date else None})
+
+        cache.evict(self.pages.key(filename) for filename in files)
+        cache.close()
+
+        return [extracted[filename] for filename in files]
 
     def extract_date(self, dataset_page):
         date_element = dataset_page.find('div', class_='information_lastupdated_value')
@@ -101,31 +169,128 @@ class OspDateAnalyzer:
             return None
         date_string = date_element.text.strip()
         return datetime.strptime(date_string, '%d.%m.%Y').date()
+
+    # Checks that the fast date extractor gives the same dates as extract_date on every saved page
+    def validate_date_extraction(self, workers = None):
+        self.pages = open_page_store(self.storage, DATASET_HTML_DIR, DATASET_PACK_DIR)
+        files = self.pages.names()
+        mismatches = 0
+
+        try:
+            files = self.pages.in_read_order(files)
+            refs = [self.pages.ref(filename) for filename in files]
+            for filename, (fast_date, full_date) in zip(files, parallel_map(compare_date_extractors, refs, workers)):
+                if fast_date != full_date:
+                    mismatches += 1
+                    print('Mismatch for', filename, ': fast extractor found', fast_date, ', full parse found', full_date)
+        finally:
+            self.pages.close()
+
+        print('Compared', len(files), 'HTML files,', mismatches, 'mismatches')
+        return mismatches == 0
     
-    def generate_list(self, data_list):
-        sorted_list = sorted(data_list)
+    # Lists the data sets by weeks since the last update, reading them in date order from the freshness index.
+    # Only the data sets of one week are sorted by name.
+    def generate_list(self, freshness):
+        today = date.today()
         with open(os.path.join(DIAGRAM_DIR, LIST_FILE), 'w', encoding='utf-8') as f:
-            original_stdout = sys.stdout
-            sys.stdout = f 
-            
-            for item in sorted_list:
-                print(item[0], 'weeks since last update for', item[1])
+            week = None
+            filenames = []
+            for filename, update_date in freshness.iter_by_date():
+                weeks = (today - update_date).days // 7
+                if weeks != week:
+                    for name in sorted(filenames):
+                        print(week, 'weeks since last update for', name, file=f)
+                    week = weeks
+                    filenames = []
+                filenames.append(filename)
+            for name in sorted(filenames):
+                print(week, 'weeks since last update for', name, file=f)
+
+    def generate_charts(self, freshness):
+        today = date.today()
+        dates = freshness.count_by_date()
+        date_data = [(today - update_date).days // 7 for update_date, count in dates]
+        counts, edges = np.histogram(date_data, bins=40, weights=[count for update_date, count in dates])
+        counts = counts.astype(int)
+        chart = make_chart(os.path.join(DIAGRAM_DIR, 'dates.pdf'), 'Datu kopu aktualitāte', 'Nedēļas kopš pēdējās datu atjaunošanas', 'Datu kopu skaits', counts, edges, (0, max(date_data) + 5))
+        render_charts([chart], self.chart_mode, DIAGRAM_DIR, 'dates')
+
+# Streams a data set page through the tokenizer only until the last updated value has been read
+class LastUpdatedParser(HTMLParser):
+
+    def __init__(self):
+        super().__init__()
+        self.depth = 0
+        self.text = []
+        self.found = False
+
+    def handle_starttag(self, tag, attrs):
+        if tag != 'div':
+            return
+        if self.depth > 0:
+            self.depth += 1
+            return
+        classes = (dict(attrs).get('class') or '').split()
+        if 'information_lastupdated_value' in classes:
+            self.depth = 1
+
+    def handle_endtag(self, tag):
+        if tag != 'div' or self.depth == 0:
+            return
+        self.depth -= 1
+        if self.depth == 0:
+            self.found = True
+            raise StopParsing()
+
+    def handle_data(self, data):
+        if self.depth > 0:
+            self.text.append(data)
+
+class StopParsing(Exception):
+    pass
+
+# Runs in a worker process. Returns the last update date of the page a page reference of the page store (see read_page)
+# points to, the content hash for the extraction cache and the time spent reading, parsing and extracting.
+def extract_date_features(page_ref):
+    start = time.perf_counter()
+    text = read_page(page_ref)
+    read_time = time.perf_counter() - start
 
-            sys.stdout = original_stdout
+    update_date, file_hash, timings = extract_date_from_text(text)
+    timings['read'] = read_time
+    return update_date, file_hash, timings
 
-    def generate_charts(self, date_data):
+# Runs in a worker process. Returns the last update date found in the page text without building the full document
+# tree, the content hash of the text and the time spent parsing and extracting. Falls back to the full parse if
+# the fast path does not find the date.
+def extract_date_from_text(text):
+    started = time.perf_counter()
+    date_string = find_last_updated(text[start:start + PARSE_CHUNK_SIZE] for start in range(0, len(text), PARSE_CHUNK_SIZE))
+    if date_string is None:
+        dataset_page = BeautifulSoup(text, 'html.parser')
+    parsed = time.perf_counter()
 
-        plt.hist(date_data, bins=40, edgecolor='black', alpha=0.7)
-        plt.title('Datu kopu aktualitāte')
-        plt.xlabel('Nedēļas kopš pēdējās datu atjaunošanas')
-        plt.ylabel('Datu kopu skaits')
-        plt.grid(True, axis='y')  
-        x_ticks = plt.xticks()[0]
-        plt.xticks(x_ticks, [int(tick) if tick.is_integer() else '' for tick in x_ticks])
+    if date_string is None:
+        update_date = OspDateAnalyzer().extract_date(dataset_page)
+    else:
+        update_date = datetime.strptime(date_string, '%d.%m.%Y').date()
+    return update_date, content_hash(text), {'parse': parsed - started, 'extract': time.perf_counter() - parsed}
 
-        plt.xlim(0, max(date_data) + 5)  
+# Feeds the chunks of a page to the tokenizer until the last updated value is found. Returns None if it is not found.
+def find_last_updated(chunks):
+    parser = LastUpdatedParser()
+    try:
+        for chunk in chunks:
+            parser.feed(chunk)
+    except StopParsing:
+        pass
 
-        plt.tight_layout()
-        plt.savefig(DIAGRAM_DIR + '/dates.pdf', format='pdf')
-        plt.close()
+    if not parser.found:
+        return None
+    return ''.join(parser.text).strip()
 
+# Runs in a worker process. Returns the dates found by the fast extractor and by the full parse.
+def compare_date_extractors(page_ref):
+    text = read_page(page_ref)
+    return extract_date_from_text(text)[0], OspDateAnalyzer().extract_date(BeautifulSoup(text, 'html.parser'))
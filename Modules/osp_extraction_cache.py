@@ -0,0 +1,85 @@
+import os
+import json
+import hashlib
+import sqlite3
+
+EXTRACTION_CACHE_FILE = 'outputs/extraction_cache.sqlite'
+
+# Hash of the page text, computed the same way by the workers and by the cache lookups
+def content_hash(text):
+    return hashlib.sha1(text.encode('utf-8')).hexdigest()
+
+def read_text(path):
+    with open(path, 'r', encoding='utf-8') as f:
+        return f.read()
+
+# Decodes downloaded page content the same way read_text would read it back from a saved file
+def decode_text(content):
+    return content.decode('utf-8').replace('\r\n', '\n').replace('\r', '\n')
+
+# On-disk cache of the features extracted from every HTML file, so that unchanged files are not parsed again.
+# Entries are keyed by path and checked against size, mtime and content hash. kind separates the analyzers.
+class OspExtractionCache:
+
+    def __init__(self, kind, path = EXTRACTION_CACHE_FILE):
+        self.kind = kind
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.connection = sqlite3.connect(path)
+        self.connection.execute('''
+            CREATE TABLE IF NOT EXISTS features (
+                kind TEXT NOT NULL,
+                path TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                mtime INTEGER NOT NULL,
+                hash TEXT NOT NULL,
+                features TEXT NOT NULL,
+                PRIMARY KEY (kind, path)
+            )''')
+
+    # Returns the cached features of the file, or None if the file is new or has changed
+    def lookup(self, path):
+        row = self.connection.execute('SELECT size, mtime, hash, features FROM features WHERE kind = ? AND path = ?', (self.kind, path)).fetchone()
+        if row is None:
+            return None
+
+        size, mtime, cached_hash, features = row
+        stat = os.stat(path)
+        if stat.st_size != size:
+            return None
+
+        if stat.st_mtime_ns != mtime:
+            # The file was touched (e.g. downloaded again), but its content may still be the same
+            if content_hash(read_text(path)) != cached_hash:
+                return None
+            self.connection.execute('UPDATE features SET mtime = ? WHERE kind = ? AND path = ?', (stat.st_mtime_ns, self.kind, path))
+
+        return json.loads(features)
+
+    def store(self, path, file_hash, features):
+        stat = os.stat(path)
+        self.connection.execute('INSERT OR REPLACE INTO features VALUES (?, ?, ?, ?, ?, ?)',
+            (self.kind, path, stat.st_size, stat.st_mtime_ns, file_hash, json.dumps(features, ensure_ascii=False)))
+
+    # Like lookup and store, for pages that are not separate files (e.g. records of a pack file), whose
+    # content hash is known without reading them
+    def lookup_hash(self, key, file_hash):
+        row = self.connection.execute('SELECT hash, features FROM features WHERE kind = ? AND path = ?', (self.kind, key)).fetchone()
+        if row is None or row[0] != file_hash:
+            return None
+        return json.loads(row[1])
+
+    def store_hash(self, key, file_hash, features):
+        self.connection.execute('INSERT OR REPLACE INTO features VALUES (?, ?, ?, ?, ?, ?)',
+            (self.kind, key, 0, 0, file_hash, json.dumps(features, ensure_ascii=False)))
+
+    # Removes the entries of files that no longer exist
+    def evict(self, existing_paths):
+        existing_paths = set(existing_paths)
+        cached_paths = [row[0] for row in self.connection.execute('SELECT path FROM features WHERE kind = ?', (self.kind,))]
+        stale_paths = [(self.kind, path) for path in cached_paths if path not in existing_paths]
+        self.connection.executemany('DELETE FROM features WHERE kind = ? AND path = ?', stale_paths)
+        return len(stale_paths)
+
+    def close(self):
+        self.connection.commit()
+        self.connection.close()
@@ -0,0 +1,156 @@
+import os
+import sqlite3
+from datetime import datetime, date, timedelta
+
+FRESHNESS_INDEX_FILE = 'outputs/freshness.sqlite'
+STALE_WEEKS = 52 # A data set that has not been updated for longer is stale
+STALENESS_BUCKETS = (4, 13, 26, 52, 104) # Bucket edges in weeks since the last update
+
+# History of the last update dates of the data sets. Every analysis adds a snapshot, and an observation for each
+# data set whose date differs from what the index already knows (or that has disappeared). The observations are
+# never changed, so the state at any snapshot can be read back. The current state is kept in a separate table
+# with an index on the date, so the reports and the staleness queries do not need to scan the history.
+class OspFreshnessIndex:
+
+    def __init__(self, path = FRESHNESS_INDEX_FILE):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.connection = sqlite3.connect(path)
+        self.connection.executescript('''
+            CREATE TABLE IF NOT EXISTS snapshots (
+                id INTEGER PRIMARY KEY,
+                taken_at TEXT NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS observations (
+                snapshot INTEGER NOT NULL,
+                dataset TEXT NOT NULL,
+                updated TEXT,
+                crawled_at TEXT,
+                removed INTEGER NOT NULL DEFAULT 0,
+                PRIMARY KEY (dataset, snapshot)
+            );
+            CREATE INDEX IF NOT EXISTS observations_snapshot ON observations (snapshot);
+            CREATE TABLE IF NOT EXISTS current (
+                dataset TEXT PRIMARY KEY,
+                updated TEXT,
+                crawled_at TEXT,
+                snapshot INTEGER NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS current_updated ON current (updated, dataset);
+        ''')
+
+    # The data sets in the current state
+    def datasets(self):
+        return {row[0] for row in self.connection.execute('SELECT dataset FROM current')}
+
+    # Adds a snapshot. observed maps data sets to their last update date (or None), and only needs to hold the
+    # data sets that may have changed since the last snapshot. existing are all data sets of the corpus, the
+    # ones missing from it are recorded as removed. Without existing, e.g. when only part of the corpus was read,
+    # nothing is recorded as removed. crawl_times maps data sets to when their page was fetched.
+    def update(self, observed, existing = None, crawl_times = None):
+        crawl_times = crawl_times or {}
+        taken_at = datetime.now().isoformat(timespec='seconds')
+        known = dict(self.connection.execute('SELECT dataset, updated FROM current'))
+
+        with self.connection:
+            snapshot = self.connection.execute('INSERT INTO snapshots (taken_at) VALUES (?)', (taken_at,)).lastrowid
+
+            changed = []
+            for dataset, update_date in observed.items():
+                updated = update_date.isoformat() if update_date else None
+                if dataset in known and known[dataset] == updated:
+                    continue
+                changed.append((snapshot, dataset, updated, crawl_times.get(dataset) or taken_at))
+            self.connection.executemany('INSERT INTO observations (snapshot, dataset, updated, crawled_at) VALUES (?, ?, ?, ?)', changed)
+            self.connection.executemany('INSERT OR REPLACE INTO current (snapshot, dataset, updated, crawled_at) VALUES (?, ?, ?, ?)', changed)
+
+            removed = []
+            if existing is not None:
+                existing = set(existing)
+                removed = [(snapshot, dataset) for dataset in known if dataset not in existing]
+            self.connection.executemany('INSERT INTO observations (snapshot, dataset, removed) VALUES (?, ?, 1)', removed)
+            self.connection.executemany('DELETE FROM current WHERE dataset = ?', [(dataset,) for snapshot, dataset in removed])
+
+        print('Freshness snapshot', snapshot, ':', len(changed), 'data sets new or changed,', len(removed), 'removed')
+        return snapshot
+
+    def snapshots(self):
+        return self.connection.execute('SELECT id, taken_at FROM snapshots ORDER BY id').fetchall()
+
+    def latest_snapshot(self):
+        return self.connection.execute('SELECT MAX(id) FROM snapshots').fetchone()[0]
+
+    # The last snapshot taken before the given time, e.g. a week ago
+    def snapshot_before(self, time):
+        row = self.connection.execute('SELECT MAX(id) FROM snapshots WHERE taken_at <= ?', (time.isoformat(timespec='seconds'),)).fetchone()
+        return row[0]
+
+    def get_taken_date(self, snapshot):
+        row = self.connection.execute('SELECT taken_at FROM snapshots WHERE id = ?', (snapshot,)).fetchone()
+        if row is None:
+            raise ValueError('There is no freshness snapshot ' + str(snapshot))
+        return datetime.fromisoformat(row[0]).date()
+
+    # Data set -> last update date (or None) at the snapshot. SQLite takes the other columns from the row with the MAX.
+    def get_state(self, snapshot):
+        rows = self.connection.execute('''
+            SELECT dataset, updated, removed, MAX(snapshot) FROM observations
+            WHERE snapshot <= ? GROUP BY dataset''', (snapshot,))
+        return {dataset: date.fromisoformat(updated) if updated else None for dataset, updated, removed, latest in rows if not removed}
+
+    # Yields (dataset, last update date) of the current state, most recently updated first
+    def iter_by_date(self):
+        for dataset, updated in self.connection.execute('SELECT dataset, updated FROM current WHERE updated IS NOT NULL ORDER BY updated DESC, dataset'):
+            yield dataset, date.fromisoformat(updated)
+
+    # (last update date, number of data sets) of the current state
+    def count_by_date(self):
+        return [(date.fromisoformat(updated), count) for updated, count in self.connection.execute('SELECT updated, COUNT(*) FROM current WHERE updated IS NOT NULL GROUP BY updated')]
+
+    # The data sets whose page has no last update date
+    def undated(self):
+        return [row[0] for row in self.connection.execute('SELECT dataset FROM current WHERE updated IS NULL ORDER BY dataset')]
+
+    # Number of current data sets per bucket of weeks since the last update as of the given day, e.g.
+    # {'0-4': 120, '4-13': 80, ..., '104-': 15}. Each bucket is a range scan of the date index.
+    def staleness_buckets(self, edges = STALENESS_BUCKETS, as_of = None):
+        as_of = as_of or date.today()
+        edges = [0] + list(edges) + [None]
+        buckets = {}
+        for lower, upper in zip(edges, edges[1:]):
+            # lower <= weeks < upper is an update date after as_of - upper weeks and up to as_of - lower weeks
+            newest = (as_of - timedelta(weeks=lower)).isoformat()
+            if upper is None:
+                count = self.connection.execute('SELECT COUNT(*) FROM current WHERE updated <= ?', (newest,)).fetchone()[0]
+            else:
+                oldest = (as_of - timedelta(weeks=upper)).isoformat()
+                count = self.connection.execute('SELECT COUNT(*) FROM current WHERE updated > ? AND updated <= ?', (oldest, newest)).fetchone()[0]
+            buckets[str(lower) + '-' + (str(upper) if upper is not None else '')] = count
+        return buckets
+
+    # The n current data sets with the oldest last update date, as (dataset, date)
+    def oldest(self, n):
+        rows = self.connection.execute('SELECT dataset, updated FROM current WHERE updated IS NOT NULL ORDER BY updated, dataset LIMIT ?', (n,))
+        return [(dataset, date.fromisoformat(updated)) for dataset, updated in rows]
+
+    # Compares two snapshots. Returns the data sets that became stale (older than weeks as of the day of the
+    # snapshot) after being fresh at the first one, and those whose last update date moved forward.
+    def changes_between(self, first, second, weeks = STALE_WEEKS):
+        first_state = self.get_state(first)
+        second_state = self.get_state(second)
+        first_cutoff = self.get_taken_date(first) - timedelta(weeks=weeks)
+        second_cutoff = self.get_taken_date(second) - timedelta(weeks=weeks)
+
+        newly_stale = []
+        refreshed = []
+        for dataset, updated in sorted(second_state.items()):
+            if dataset not in first_state or updated is None:
+                continue
+            previous = first_state[dataset]
+            if updated < second_cutoff and previous is not None and previous >= first_cutoff:
+                newly_stale.append((dataset, updated))
+            if previous is None or updated > previous:
+                refreshed.append((dataset, previous, updated))
+        return newly_stale, refreshed
+
+    def close(self):
+        self.connection.close()
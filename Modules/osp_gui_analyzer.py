@@ -1,220 +1,365 @@
 import os
-import sys
-import requests
 import time
+import requests
 import re
+import html
+
+from bs4 import BeautifulSoup, Tag
+import numpy as np
 
-from bs4 import BeautifulSoup
-import matplotlib.pyplot as plt
+from Modules.osp_manifest import UNCHANGED
+from Modules.osp_parallel import parallel_map
+from Modules.osp_section_matrix import OspSectionMatrix
+from Modules.osp_charts import compute_histogram, make_chart, render_charts
+from Modules.osp_extraction_cache import OspExtractionCache, content_hash
+from Modules.osp_page_store import open_page_store, read_page
+from Modules.osp_metrics import OspMetrics
+from Modules.osp_crawl_analyzer import OspPageAnalyzer
 
 ALL_TABLES_URL = 'https://data.stat.gov.lv/api/v1/lv/OSP_PUB?query=*&filter=*'
 TABLE_URL_BASE = 'https://data.stat.gov.lv/pxweb/lv/OSP_PUB/START__'
 METADATA_HTML_DIR = 'outputs/metadata_pages'
+METADATA_PACK_DIR = 'outputs/metadata_pages_pack'
 METADATA_DIAGRAM_DIR = 'outputs/metadata_diagrams'
-STATS_FILE = 'missing_sections.txt'
-
-class OspGuiAnalyzer:
-
-    def __init__(self, table_limit = 3, sleep_time = 2):
-        self.tables_read = 0
-        self.table_limit = table_limit
-        self.sleep_time = sleep_time
+STATS_FILE = 'missing_%s.txt' # One per level, e.g. missing_subsections.txt
+MANIFEST_NAME = 'metadata_pages'
+JOURNAL_NAME = 'metadata_pages'
+SECTION_ELEMENTS = {False: 'h2', True: 'h3'}
+SECTION_LEVEL_NAMES = {False: 'sections', True: 'subsections'}
+EXTRACTION_CACHE_KIND = 'metadata_sections'
+METADATA_LINK_PATTERN = re.compile(r'<[aA]\b([^>]*)>Metadati</[aA]\s*>')
+HREF_PATTERN = re.compile(r'''\bhref\s*=\s*(?:"([^"]*)"|'([^']*)'|([^\s"'>]+))''', re.IGNORECASE)
+
+class OspGuiAnalyzer(OspPageAnalyzer):
+
+    manifest_name = MANIFEST_NAME
+    journal_name = JOURNAL_NAME
+    html_dir = METADATA_HTML_DIR
+    pack_dir = METADATA_PACK_DIR
+
+    # With only_failed=True only the data sets in the failure queue of the journal are downloaded again.
+    # With analyze=True the pages are parsed while they are downloaded and the section reports for levels
+    # are generated when the crawl ends. The HTML is then only saved if keep_html is True or a saved copy already exists.
+    def read_metadata(self, only_failed = False, analyze = False, keep_html = False, workers = None, levels = (False, True)):
+        self.levels = list(levels)
+        self.crawl_pages(ALL_TABLES_URL, self.download_metadata, process_metadata_text, only_failed, analyze, keep_html, workers)
+
+    def get_pipeline_task(self, text):
+        return (text, self.levels)
+
+    # Generates the section reports from the sections parsed during the crawl
+    def report_pipeline_results(self, files, sections_list, workers = None):
+        self.report_sections(files, sections_list, self.levels, workers)
+
+    # Downloads the table page and then the metadata page it links to. The metadata page keeps its URL when the
+    # data set is updated, so the URL from the last crawl is tried first and the table page is only read if it fails.
+    def download_metadata(self, table):
+        url_ending = self.get_url_ending(table)
+        updated = table.get('updated')
+        metadata_filename = self.get_dataset_filename(table)
+
+        if self.incremental and self.manifest.is_unchanged(metadata_filename, updated) and self.pages.contains(metadata_filename):
+            return UNCHANGED
+
+        metadata_url = self.manifest.get_url(metadata_filename) if self.incremental else None
+        if metadata_url is not None:
+            result = self.fetch_metadata_page(metadata_url, metadata_filename, updated, known_link=True)
+            if result is not None:
+                return result
+
+        print('Read table (', TABLE_URL_BASE + url_ending, ')...')
 
-    def read_metadata(self):
-        response = requests.get(ALL_TABLES_URL)
-
-        if response.status_code != 200:
-            print('Error:', response.status_code)
-            return
-        self.tables = response.json()
-
-        for i in range(len(self.tables)):
-            if i >= self.table_limit:
-                break
-
-            time.sleep(self.sleep_time)
+        try:
+            table_response = self.crawler.get(TABLE_URL_BASE + url_ending)
+        except requests.exceptions.RequestException as errh:
+            print('Failed reading the table page: ', errh)
+            self.journal.mark_failed(metadata_filename, errh)
+            return False
 
-            url_ending = self.tables[i]['path'][1:]
-            url_ending = url_ending.replace('/', '__')
-            url_ending += '/' + self.tables[i]['id']
+        if table_response.status_code != 200:
+            print('Failed reading the table page: ', TABLE_URL_BASE + url_ending, 'returned', table_response.status_code)
+            self.journal.mark_failed(metadata_filename, 'HTTP ' + str(table_response.status_code))
+            return False
 
-            print('Read table (', TABLE_URL_BASE + url_ending, ')...')
+        return self.download_metadata_page(table_response, url_ending, updated)
 
-            try:
-                table_response = requests.get(TABLE_URL_BASE + url_ending)
-                requestSuccessful = True
-            except requests.exceptions as errh:
-                print('Failed reading the table page: ', errh)
+    # Returns True if the page was saved, UNCHANGED if the saved copy is still current and False on failure
+    def download_metadata_page(self, table_response, url_ending, updated = None):
+        metadata_filename = url_ending.replace('/', '__') + '.html'
+        metadata_url = find_metadata_link(table_response.text)
 
-            if not requestSuccessful:
-                continue
+        if metadata_url is None:
+            # The quick scan only knows the usual markup, the full parse finds the link wherever it is
+            table_page_html = BeautifulSoup(table_response.text, 'html.parser')
+            metadata_link = table_page_html.find('a', text='Metadati')
 
-            self.download_metadata_page(table_response, url_ending)
-            print('Saved metadata HTML file ', i+1, '/', min(self.table_limit, len(self.tables)), ': ', url_ending.replace('/', '__') + '.html')
+            if metadata_link is None:
+                print ('Warning: Did not find metadata for', TABLE_URL_BASE + url_ending, '. Skipping.')
+                self.journal.mark_failed(metadata_filename, 'No metadata link')
+                return False
+            metadata_url = metadata_link['href']
 
-    def download_metadata_page(self, table_response, url_ending):
-        table_page_html = BeautifulSoup(table_response.text, 'html.parser')
-        metadata_link = table_page_html.find('a', text='Metadati')
+        return self.fetch_metadata_page(metadata_url, metadata_filename, updated)
 
-        if metadata_link is None:
-            print ('Warning: Did not find metadata for', TABLE_URL_BASE + url_ending, '. Skipping.')
-            return
+    # Returns True if the page was saved, UNCHANGED if the saved copy is still current and False on failure.
+    # A failed known_link returns None instead, so that the caller can look up the current link on the table page.
+    def fetch_metadata_page(self, metadata_url, metadata_filename, updated = None, known_link = False):
+        headers = {}
+        if self.incremental and self.pages.contains(metadata_filename):
+            headers = self.manifest.conditional_headers(metadata_filename, metadata_url)
 
         try:
-            metadata_response = requests.get(metadata_link['href'])
-            requestSuccessful = True
-        except requests.exceptions as errh:
+            metadata_response = self.crawler.get(metadata_url, headers=headers)
+        except requests.exceptions.RequestException as errh:
             print('Failed reading the metadata page: ', errh)
+            return self.fail_metadata_page(metadata_filename, errh, known_link)
         except Exception as err:
             print('Failed reading the metadata page: ', err)
+            return self.fail_metadata_page(metadata_filename, err, known_link)
 
-        if not requestSuccessful:
-            return
+        if metadata_response.status_code == 304:
+            self.manifest.touch(metadata_filename, updated)
+            return UNCHANGED
 
-        print('Read metadata (' , metadata_link['href'], ')...')
+        if metadata_response.status_code != 200:
+            print('Failed reading the metadata page: ', metadata_url, 'returned', metadata_response.status_code)
+            return self.fail_metadata_page(metadata_filename, 'HTTP ' + str(metadata_response.status_code), known_link)
 
-        metadata_filename = url_ending.replace('/', '__') + '.html'
-        path = os.path.join(METADATA_HTML_DIR, metadata_filename)
-        with open(path, 'wb') as f:
-            f.write(metadata_response.content)
+        print('Read metadata (' , metadata_url, ')...')
+        return self.store_page(metadata_filename, metadata_url, metadata_response, updated)
 
+    def fail_metadata_page(self, metadata_filename, error, known_link):
+        if known_link:
+            print('Reading the metadata link of', metadata_filename, 'from the table page again')
+            return None
+        self.journal.mark_failed(metadata_filename, error)
+        return False
 
-    def analyze_metadata(self, subsections = False):
+    # Parses the metadata pages in a pool of worker processes. workers defaults to the number of cores.
+    # Unchanged pages are loaded from the extraction cache unless use_cache is False.
+    def analyze_metadata(self, subsections = False, workers = None, use_cache = True):
+        self.analyze_metadata_levels([subsections], workers, use_cache)
 
-        try:
-            os.remove(os.path.join(METADATA_DIAGRAM_DIR, STATS_FILE))
-        except:
-            pass
+    # Produces both the section and the subsection reports from a single pass over the metadata pages
+    def analyze_metadata_all_levels(self, workers = None, use_cache = True):
+        self.analyze_metadata_levels([False, True], workers, use_cache)
 
-        section_length_data = []
-        section_content_data = []
-        section_filenames = []
+    def analyze_metadata_levels(self, levels, workers = None, use_cache = True):
+        self.pages = open_page_store(self.storage, METADATA_HTML_DIR, METADATA_PACK_DIR)
+        files = self.pages.names()
 
-        files = os.listdir(METADATA_HTML_DIR)
-        
-        total_working_metadata_pages = 0
+        self.metrics = OspMetrics(EXTRACTION_CACHE_KIND)
+        try:
+            self.report_sections(files, self.extract_sections(files, levels, workers, use_cache), levels, workers)
+        finally:
+            self.metrics.close()
+            self.pages.close()
+
+    # Writes the empty section lists, the statistics and the charts for every level, given the sections of every file
+    def report_sections(self, files, sections_list, levels, workers = None):
+        section_length_data = {subsections: [] for subsections in levels}
+        section_content_data = {subsections: [] for subsections in levels}
+        section_filenames = []
 
-        for filename in files:
-            if filename.endswith('.html'):
-                file_path = os.path.join(METADATA_HTML_DIR, filename)
-                with open(file_path, 'r', encoding='utf-8') as f:
-                    total_working_metadata_pages += 1
-                    metadata_page = BeautifulSoup(f.read(), 'html.parser')
-
-                    section_lengths, section_contents = self.process_sections(filename, metadata_page, subsections)
-                    
-                    section_length_data.append(section_lengths)
-                    section_content_data.append(section_contents)
-                    section_filenames.append(filename)
-
-                    print('Processed', len(section_length_data), '/', len(files), 'HTML metadata files', end='\r')
-                    if len(section_lengths) < 4:
-                        print('Warning: Data set', file_path, 'has', len(section_lengths), 'sections. ')
-        
-        # Group section lengths by section title
-        grouped_sections = self.group_sections(section_length_data, total_working_metadata_pages)
+        for filename, sections in zip(files, sections_list):
+            section_filenames.append(filename)
+            print('Processed', len(section_filenames), '/', len(files), 'HTML metadata files', end='\r')
 
-        self.print_empty_sections(grouped_sections, section_length_data, section_filenames, section_content_data, subsections)
-        self.generate_charts(grouped_sections)
+            for subsections in levels:
+                section_lengths, section_contents = sections[subsections]
+                section_length_data[subsections].append(section_lengths)
+                section_content_data[subsections].append(section_contents)
 
+                if len(section_lengths) < 4:
+                    print('Warning: Data set', self.pages.key(filename), 'has', len(section_lengths), 'sections. ')
+        
+        for subsections in levels:
+            section_matrix = OspSectionMatrix(section_length_data[subsections], section_content_data[subsections], section_filenames)
+
+            # Group section lengths by section title
+            grouped_sections = self.group_sections(section_matrix)
+
+            self.print_empty_sections(section_matrix, subsections)
+            self.print_section_statistics(section_matrix, subsections)
+            with self.metrics.timer('render', level=SECTION_LEVEL_NAMES[subsections]):
+                self.generate_charts(grouped_sections, SECTION_LEVEL_NAMES[subsections], workers)
+
+    # Returns the sections of every file in files. With use_cache only new and changed files are parsed,
+    # and always for both levels so that either report can be served from the cache later.
+    def extract_sections(self, files, levels, workers = None, use_cache = True):
+        if not use_cache:
+            extracted = {}
+            ordered_files = self.pages.in_read_order(files)
+            tasks = [(self.pages.ref(filename), levels) for filename in ordered_files]
+            for filename, (sections, file_hash, timings) in zip(ordered_files, parallel_map(process_metadata_file, tasks, workers)):
+                self.metrics.record_file(filename, timings)
+                extracted[filename] = sections
+            return [extracted[filename] for filename in files]
+
+        cache = OspExtractionCache(EXTRACTION_CACHE_KIND)
+        extracted = {}
 
-    # Create a separate histogram for each section
-    def generate_charts(self, grouped_sections):
+        for filename in files:
+            features = self.pages.cache_lookup(cache, filename)
+            if features is not None:
+                extracted[filename] = {subsections: features[name] for subsections, name in SECTION_LEVEL_NAMES.items()}
+
+        changed_files = [filename for filename in files if filename not in extracted]
+        print('Loaded', len(extracted), 'HTML metadata files from the extraction cache, parsing', len(changed_files))
+        self.metrics.count('cache_hits', len(extracted))
+
+        # Parsed in the order of the pack file, the results are returned in the order of files
+        ordered_files = self.pages.in_read_order(changed_files)
+        tasks = [(self.pages.ref(filename), list(SECTION_LEVEL_NAMES)) for filename in ordered_files]
+        for filename, (sections, file_hash, timings) in zip(ordered_files, parallel_map(process_metadata_file, tasks, workers)):
+            self.metrics.record_file(filename, timings)
+            extracted[filename] = sections
+            features = {name: sections[subsections] for subsections, name in SECTION_LEVEL_NAMES.items()}
+            self.pages.cache_store(cache, filename, file_hash, features)
+            print('Parsed', len(extracted), '/', len(files), 'HTML metadata files', end='\r')
+
+        cache.evict(self.pages.key(filename) for filename in files)
+        cache.close()
+
+        return [extracted[filename] for filename in files]
+
+    # Create a separate histogram for each section. The histograms are rendered in parallel worker processes,
+    # or written to one multi-page PDF or only as histogram data, depending on chart_mode.
+    def generate_charts(self, grouped_sections, name = 'sections', workers = None):
+        charts = []
         for section_title, section_lengths in grouped_sections.items():
+            counts, edges, max_x = compute_histogram(section_lengths, 20)
+            path = os.path.join(METADATA_DIAGRAM_DIR, self.get_safe_string(section_title) + '.pdf')
+            charts.append(make_chart(path, section_title, 'Sadaļas garums', 'Datu kopu skaits', counts, edges, (0, max_x)))
 
-            max_length = max(section_lengths)
-            step = max(max_length // 20, 1)
-
-            plt.hist(section_lengths, bins=range(0, max_length + step, step), edgecolor='black', alpha=0.7)
-            plt.title(section_title)
-            plt.xlabel('Sadaļas garums')
-            plt.ylabel('Datu kopu skaits')
-            plt.grid(True, axis='y')  
-            x_ticks = plt.xticks()[0]
-            plt.xticks(x_ticks, [int(tick) if tick.is_integer() else '' for tick in x_ticks])
-
-            plt.xlim(0, max_length + step)  
-            plt.tight_layout()
-            plt.savefig('outputs/metadata_diagrams/' + self.get_safe_string(section_title) + '.pdf', format='pdf')
-            plt.close()
+        render_charts(charts, self.chart_mode, METADATA_DIAGRAM_DIR, name, workers)
 
-    def print_empty_sections(self, grouped_sections, section_length_data, section_filenames, section_content_data, subsections):
+    def print_empty_sections(self, section_matrix, subsections):
         empty_threshold = 5 if subsections else 100 # Let's consider subsection to be empty if it has <=5 characters but large section to be empty if it has <=100
 
-        for section in grouped_sections:
-            original_stdout = sys.stdout
+        for section in section_matrix.titles:
+            missing, empty = section_matrix.find_empty(section, empty_threshold)
 
-            try:
-                os.remove(os.path.join(METADATA_DIAGRAM_DIR, self.get_safe_string(section) + '.txt'))
-            except:
-                pass
+            lines = []
+            for i in np.flatnonzero(missing | empty):
+                if missing[i]:
+                    lines.append('Section " ' + section + ' " does not exist for  ' + section_matrix.filenames[i] + '\n')
+                else:
+                    lines.append('Section " ' + section + ' " in ' + section_matrix.filenames[i] + ' only has ' + str(section_matrix.lengths[i, section_matrix.columns[section]]) + ' characters. Content: ' + section_matrix.get_content(i, section) + '\n')
 
-            with open(os.path.join(METADATA_DIAGRAM_DIR, self.get_safe_string(section) + '.txt'), 'a', encoding='utf-8') as f:
-                sys.stdout = f 
+            with open(os.path.join(METADATA_DIAGRAM_DIR, self.get_safe_string(section) + '.txt'), 'w', encoding='utf-8') as f:
+                f.write(''.join(lines))
 
-                for i in range(0, len(section_length_data)):
-                    if not section in section_length_data[i]:
-                        print('Section "', section, '" does not exist for ', section_filenames[i])
-                    elif section_length_data[i][section] <= empty_threshold:
-                        print('Section "', section , '" in', section_filenames[i],'only has', section_length_data[i][section], 'characters. Content:', section_content_data[i][section])
-                sys.stdout = original_stdout
+    # Writes how often each section exists, is missing or is empty, and its mean and maximum length
+    def print_section_statistics(self, section_matrix, subsections):
+        empty_threshold = 5 if subsections else 100
+        lines = ['Subsections\n' if subsections else 'Sections\n']
+        for section, statistics in section_matrix.get_statistics(empty_threshold).items():
+            lines.append('Section " ' + section + ' ": present in ' + str(statistics['present']) + ', missing in ' + str(statistics['missing']) + ', empty in ' + str(statistics['empty']) + ', mean length ' + str(round(statistics['mean_length'], 1)) + ', max length ' + str(statistics['max_length']) + '\n')
 
-    # Group section lengths by section title
-    def group_sections(self, section_length_data, total_working_metadata_pages):
-        grouped_sections = {}
-        for section_lengths in section_length_data:
-            for section_title, section_length in section_lengths.items():
-                if section_title not in grouped_sections:
-                    grouped_sections[section_title] = []
-                grouped_sections[section_title].append(section_length)
+        # Each level has its own file, so that reporting one level leaves the statistics of the other
+        with open(os.path.join(METADATA_DIAGRAM_DIR, STATS_FILE % SECTION_LEVEL_NAMES[subsections]), 'w', encoding='utf-8') as f:
+            f.write(''.join(lines))
 
-        # Add zeros for length of non-existant sections
-        for section in grouped_sections:
-            for i in range(0, total_working_metadata_pages - len(grouped_sections[section])):
-                grouped_sections[section].append(0)
-
-        return grouped_sections
+    # Group section lengths by section title. Files without the section have length 0.
+    def group_sections(self, section_matrix):
+        return {section_title: section_matrix.get_lengths(section_title) for section_title in section_matrix.titles}
 
     def process_sections(self, filename, metadata_page, subsections):
-        element_name = 'h3' if subsections else 'h2'
-        subheaders = metadata_page.find_all(element_name)
-
-        section_lengths = {}
-        section_contents = {}
-        
-        for i in range(len(subheaders)):
-            subheader = subheaders[i]
-
-            if subheader.find_parents('footer'):
-                continue
-
-            section_text = ''
-
-            next_subheader = None
-            if i + 1 < len(subheaders):
-                next_subheader = subheaders[i+1]
-
-            section = subheader.find_next_sibling()
-            while section is not None and section != next_subheader:
-                section_text += section.get_text().strip()
-                section = section.find_next_sibling()
-
-            # print('Length', len(section_text), ':', section_text)
-
-            section_title = subheader.get_text().strip()
-            section_lengths[section_title] = len(section_text)
-            section_contents[section_title] = section_text
-
-            # if len(section_text) <= empty_threshold:
-            #     original_stdout = sys.stdout
-            #     with open(os.path.join(METADATA_DIAGRAM_DIR, STATS_FILE), 'a', encoding='utf-8') as f:
-            #         sys.stdout = f # Change the standard output to the file we created.
-            #         print('Section "', section_title, '" might be empty (', len(section_text),') for', filename,'. Contents:', section_text)
-            #         sys.stdout = original_stdout # Reset the standard output to its original value
-
-        return section_lengths, section_contents
+        return self.segment_sections(metadata_page, [subsections])[subsections]
+
+    # Splits the page into sections (h2, subsections=False) and/or subsections (h3, subsections=True) in one pass.
+    # Returns the section lengths and contents for every requested level.
+    def segment_sections(self, metadata_page, levels = (False, True)):
+        subheaders_by_level = {subsections: [] for subsections in levels}
+        for subheader in metadata_page.find_all([SECTION_ELEMENTS[subsections] for subsections in levels]):
+            subheaders_by_level[subheader.name == SECTION_ELEMENTS[True]].append(subheader)
+
+        # Both levels walk the same siblings, so every element's text is extracted only once
+        siblings = {}
+        texts = {}
+        results = {}
+
+        for subsections in levels:
+            subheaders = subheaders_by_level[subsections]
+            section_lengths = {}
+            section_contents = {}
+
+            for i in range(len(subheaders)):
+                subheader = subheaders[i]
+
+                if subheader.find_parents('footer'):
+                    continue
+
+                next_subheader = None
+                if i + 1 < len(subheaders):
+                    next_subheader = subheaders[i+1]
+
+                # The section runs over the following siblings up to the next subheader or the end of the parent
+                children, positions = self.get_siblings(subheader.parent, siblings)
+                # (Tags compare by content, so an identical subheader earlier among the siblings also ends the section.)
+                start = positions[id(subheader)] + 1
+                end = len(children)
+                if next_subheader is not None:
+                    for position in range(start, len(children)):
+                        if children[position] == next_subheader:
+                            end = position
+                            break
+
+                section_parts = []
+                for section in children[start:end]:
+                    if id(section) not in texts:
+                        texts[id(section)] = section.get_text().strip()
+                    section_parts.append(texts[id(section)])
+                section_text = ''.join(section_parts)
+
+                section_title = subheader.get_text().strip()
+                section_lengths[section_title] = len(section_text)
+                section_contents[section_title] = section_text
+
+            results[subsections] = (section_lengths, section_contents)
+
+        return results
+
+    # Returns the child elements of parent and their positions, computed once per parent
+    def get_siblings(self, parent, siblings):
+        if id(parent) not in siblings:
+            children = [child for child in parent.children if isinstance(child, Tag)]
+            siblings[id(parent)] = (children, {id(child): position for position, child in enumerate(children)})
+        return siblings[id(parent)]
 
     def get_safe_string(self, str):
         return re.sub(r'[\W_]', '', str)
-                
-    
\ No newline at end of file
+
+# Runs in a worker process. Parses one metadata page and returns only the extracted section lengths and contents
+# per level, together with the content hash for the extraction cache and the time spent reading, parsing and extracting.
+# The page is given by its reference in the page store, see read_page.
+def process_metadata_file(task):
+    page_ref, levels = task
+    start = time.perf_counter()
+    text = read_page(page_ref)
+    read_time = time.perf_counter() - start
+
+    sections, file_hash, timings = process_metadata_text((text, levels))
+    timings['read'] = read_time
+    return sections, file_hash, timings
+
+# Runs in a worker process. Like process_metadata_file, but for page text that has not been saved to a file.
+def process_metadata_text(task):
+    text, levels = task
+    start = time.perf_counter()
+    metadata_page = BeautifulSoup(text, 'html.parser')
+    parsed = time.perf_counter()
+    sections = OspGuiAnalyzer().segment_sections(metadata_page, levels)
+    return sections, content_hash(text), {'parse': parsed - start, 'extract': time.perf_counter() - parsed}
+
+# Finds the href of the "Metadati" link without parsing the whole table page. Returns None if the scan
+# does not find it, e.g. when the link text is wrapped in another element.
+def find_metadata_link(page_text):
+    match = METADATA_LINK_PATTERN.search(page_text)
+    if match is None:
+        return None
+    href = HREF_PATTERN.search(match.group(1))
+    if href is None:
+        return None
+    return html.unescape(next(group for group in href.groups() if group is not None))
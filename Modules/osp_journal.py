@@ -0,0 +1,73 @@
+import os
+import json
+import threading
+from datetime import datetime
+
+JOURNAL_DIR = 'outputs/journals'
+DONE = 'done'
+FAILED = 'failed'
+
+# Append-only checkpoint journal of completed and failed data sets, used to resume interrupted crawls
+class OspJournal:
+
+    def __init__(self, name):
+        self.path = os.path.join(JOURNAL_DIR, name + '.jsonl')
+        self.done = set()
+        self.failed = {}
+        self.lock = threading.Lock()
+
+        if os.path.isfile(self.path):
+            with open(self.path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        continue # The last line may be cut off if the process was killed while writing it
+                    self.apply(entry)
+
+        os.makedirs(JOURNAL_DIR, exist_ok=True)
+        self.file = open(self.path, 'a', encoding='utf-8')
+
+    def apply(self, entry):
+        dataset = entry['dataset']
+        if entry['status'] == DONE:
+            self.done.add(dataset)
+            self.failed.pop(dataset, None)
+        else:
+            self.failed[dataset] = entry
+            self.done.discard(dataset)
+
+    def is_done(self, dataset):
+        return dataset in self.done
+
+    def mark_done(self, dataset):
+        self.append({'dataset': dataset, 'status': DONE})
+
+    def mark_failed(self, dataset, error):
+        self.append({'dataset': dataset, 'status': FAILED, 'error': str(error)})
+
+    def append(self, entry):
+        entry['time'] = datetime.now().isoformat(timespec='seconds')
+        with self.lock:
+            self.apply(entry)
+            self.file.write(json.dumps(entry, ensure_ascii=False) + '\n')
+            self.file.flush()
+
+    # Returns the items still to be crawled: everything not done yet, or only the failed ones when re-running the failure queue
+    def pending(self, items, get_dataset, only_failed = False):
+        if only_failed:
+            return [item for item in items if get_dataset(item) in self.failed]
+        return [item for item in items if get_dataset(item) not in self.done]
+
+    # Called when a crawl has covered all data sets. Only the failure queue is kept for the next run.
+    def finish(self):
+        with self.lock:
+            self.file.close()
+            with open(self.path, 'w', encoding='utf-8') as f:
+                for entry in self.failed.values():
+                    f.write(json.dumps(entry, ensure_ascii=False) + '\n')
+            self.done = set()
+            self.file = open(self.path, 'a', encoding='utf-8')
+
+    def close(self):
+        self.file.close()
@@ -0,0 +1,92 @@
+import os
+import json
+import hashlib
+import threading
+from datetime import datetime
+
+MANIFEST_DIR = 'outputs/manifests'
+SAVE_EVERY = 100
+UNCHANGED = 'unchanged' # Download result for pages that did not change since the last crawl
+
+# Remembers what was downloaded for every data set so that re-crawls can skip unchanged pages
+class OspManifest:
+
+    def __init__(self, name):
+        self.path = os.path.join(MANIFEST_DIR, name + '.json')
+        self.records = {}
+        self.unsaved = 0
+        self.lock = threading.Lock()
+
+        if os.path.isfile(self.path):
+            with open(self.path, 'r', encoding='utf-8') as f:
+                self.records = json.load(f)
+
+    def get(self, dataset):
+        return self.records.get(dataset)
+
+    # The URL the page of the data set was last fetched from, e.g. the metadata page a table page links to
+    def get_url(self, dataset):
+        record = self.records.get(dataset)
+        return record.get('url') if record is not None else None
+
+    # True if the table listing reports the same 'updated' value as during the last crawl
+    def is_unchanged(self, dataset, updated):
+        record = self.records.get(dataset)
+        return updated is not None and record is not None and record.get('updated') == updated
+
+    # Headers for a conditional request, so that the server can answer 304 Not Modified
+    def conditional_headers(self, dataset, url):
+        record = self.records.get(dataset)
+        headers = {}
+        if record is None or record.get('url') != url:
+            return headers
+        if record.get('etag'):
+            headers['If-None-Match'] = record['etag']
+        if record.get('last_modified'):
+            headers['If-Modified-Since'] = record['last_modified']
+        return headers
+
+    # Stores a fetched page. Returns True if its content differs from the previous crawl.
+    def record(self, dataset, url, content, headers = None, updated = None):
+        content_hash = hashlib.sha256(content).hexdigest()
+        headers = headers or {}
+
+        with self.lock:
+            previous = self.records.get(dataset, {})
+            self.records[dataset] = {
+                'url': url,
+                'etag': headers.get('ETag'),
+                'last_modified': headers.get('Last-Modified'),
+                'hash': content_hash,
+                'fetched_at': datetime.now().isoformat(timespec='seconds'),
+                'updated': updated if updated is not None else previous.get('updated'),
+            }
+            self.mark_unsaved()
+
+        return previous.get('hash') != content_hash
+
+    # Notes that the page was checked and found unchanged (e.g. the server answered 304)
+    def touch(self, dataset, updated = None):
+        with self.lock:
+            record = self.records[dataset]
+            record['fetched_at'] = datetime.now().isoformat(timespec='seconds')
+            if updated is not None:
+                record['updated'] = updated
+            self.mark_unsaved()
+
+    def mark_unsaved(self):
+        self.unsaved += 1
+        if self.unsaved >= SAVE_EVERY:
+            self.write()
+
+    def save(self):
+        with self.lock:
+            self.write()
+
+    def write(self):
+        os.makedirs(MANIFEST_DIR, exist_ok=True)
+        temp_path = self.path + '.tmp'
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.records, f, indent=4, ensure_ascii=False)
+        os.replace(temp_path, self.path)
+        self.unsaved = 0
@@ -0,0 +1,114 @@
+import os
+import json
+import time
+import threading
+import contextlib
+from collections import Counter
+from datetime import datetime
+
+METRICS_DIR = 'outputs/metrics'
+PROMETHEUS_DIR = os.environ.get('OSP_PROMETHEUS_DIR') # e.g. the textfile collector directory of node_exporter
+
+# Records where the time of a crawl or an analysis goes. Every event is appended to outputs/metrics/<name>.jsonl,
+# timings and counters are summed up and written to <name>-summary.json (and <name>.prom in PROMETHEUS_DIR) by close().
+class OspMetrics:
+
+    def __init__(self, name, prometheus_dir = PROMETHEUS_DIR):
+        self.name = name
+        self.prometheus_dir = prometheus_dir
+        self.run = datetime.now().isoformat(timespec='seconds')
+        self.started = time.perf_counter()
+        self.timings = {} # Metric -> [count, total seconds, max seconds]
+        self.counters = Counter()
+        self.lock = threading.Lock()
+
+        os.makedirs(METRICS_DIR, exist_ok=True)
+        self.log = open(os.path.join(METRICS_DIR, name + '.jsonl'), 'a', encoding='utf-8')
+
+    def event(self, kind, **fields):
+        record = {'run': self.run, 'event': kind, 'at': round(time.perf_counter() - self.started, 6)}
+        record.update(fields)
+        line = json.dumps(record, ensure_ascii=False, default=str) + '\n'
+        with self.lock:
+            self.log.write(line)
+
+    def observe(self, metric, seconds):
+        with self.lock:
+            timing = self.timings.setdefault(metric, [0, 0.0, 0.0])
+            timing[0] += 1
+            timing[1] += seconds
+            timing[2] = max(timing[2], seconds)
+
+    def count(self, counter, value = 1):
+        with self.lock:
+            self.counters[counter] += value
+
+    # Times the block as metric and logs it as an event with the given fields
+    @contextlib.contextmanager
+    def timer(self, metric, **fields):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            seconds = time.perf_counter() - start
+            self.observe(metric, seconds)
+            self.event(metric, seconds=seconds, **fields)
+
+    # Logs the timings measured by a worker process for one file, e.g. {'read': ..., 'parse': ..., 'extract': ...}
+    def record_file(self, filename, timings):
+        for step, seconds in timings.items():
+            self.observe('file_' + step, seconds)
+        self.event('file', file=filename, **timings)
+
+    def summary(self):
+        with self.lock:
+            return {
+                'name': self.name,
+                'run': self.run,
+                'seconds': time.perf_counter() - self.started,
+                'timings': {metric: {'count': count, 'total': total, 'mean': total / count, 'max': maximum} for metric, (count, total, maximum) in self.timings.items()},
+                'counters': dict(self.counters),
+            }
+
+    def print_summary(self, summary):
+        print('Metrics for', self.name, 'after', round(summary['seconds'], 1), 's:')
+        for metric, timing in sorted(summary['timings'].items(), key=lambda item: -item[1]['total']):
+            print('  %-24s %8d x  %10.2f s total  %10.2f ms mean  %10.2f ms max' % (metric, timing['count'], timing['total'], timing['mean'] * 1000, timing['max'] * 1000))
+        for counter, value in sorted(summary['counters'].items()):
+            print('  %-24s %8d' % (counter, value))
+
+    # Writes the summary in the Prometheus text format
+    def write_prometheus(self, summary):
+        labels = 'name="' + self.name + '"'
+        lines = [
+            '# HELP osp_run_seconds Duration of the crawl or analysis.',
+            '# TYPE osp_run_seconds gauge',
+            'osp_run_seconds{' + labels + '} ' + repr(summary['seconds']),
+            '# HELP osp_step_seconds Time spent in each step.',
+            '# TYPE osp_step_seconds summary',
+        ]
+        for metric, timing in sorted(summary['timings'].items()):
+            lines.append('osp_step_seconds_sum{' + labels + ',step="' + metric + '"} ' + repr(timing['total']))
+            lines.append('osp_step_seconds_count{' + labels + ',step="' + metric + '"} ' + str(timing['count']))
+        lines.append('# HELP osp_events_total Counted events, e.g. retries or cache hits.')
+        lines.append('# TYPE osp_events_total counter')
+        for counter, value in sorted(summary['counters'].items()):
+            lines.append('osp_events_total{' + labels + ',event="' + counter + '"} ' + str(value))
+
+        # Written under a temporary name first, so that the collector never reads a partial file
+        os.makedirs(self.prometheus_dir, exist_ok=True)
+        path = os.path.join(self.prometheus_dir, 'osp_' + self.name + '.prom')
+        with open(path + '.tmp', 'w', encoding='utf-8') as f:
+            f.write('\n'.join(lines) + '\n')
+        os.replace(path + '.tmp', path)
+
+    def close(self):
+        summary = self.summary()
+        self.event('summary', **summary)
+        self.log.close()
+
+        with open(os.path.join(METRICS_DIR, self.name + '-summary.json'), 'w', encoding='utf-8') as f:
+            json.dump(summary, f, indent=4, ensure_ascii=False)
+        if self.prometheus_dir:
+            self.write_prometheus(summary)
+        self.print_summary(summary)
@@ -0,0 +1,232 @@
+import os
+import mmap
+import zlib
+import struct
+import sqlite3
+import threading
+
+from Modules.osp_extraction_cache import content_hash, read_text, decode_text
+
+STORAGE_MODES = ('files', 'pack') # Loose .html files, or one compressed pack file per page kind
+DEFAULT_STORAGE = os.environ.get('OSP_PAGE_STORAGE', 'files') # So that the analyze_*.py scripts read the pages where they were downloaded to
+PACK_FILE = 'pages.pack'
+INDEX_FILE = 'index.sqlite'
+RECORD_MAGIC = b'OSPK'
+RECORD_HEADER = struct.Struct('<4sII') # Magic, length of the name, length of the compressed page
+COMPRESSION_LEVEL = 6
+
+# The saved pages of one kind as loose .html files in a directory, the way they have always been stored
+class OspPageFiles:
+
+    def __init__(self, directory):
+        self.directory = directory
+
+    # Key of the page in the extraction cache
+    def key(self, name):
+        return os.path.join(self.directory, name)
+
+    def contains(self, name):
+        return os.path.isfile(self.key(name))
+
+    def put(self, name, content):
+        with open(self.key(name), 'wb') as f:
+            f.write(content)
+
+    def read(self, name):
+        return read_text(self.key(name))
+
+    # Sorted, so that the results do not depend on the order of the directory listing
+    def names(self):
+        return sorted(name for name in os.listdir(self.directory) if name.endswith('.html'))
+
+    # What a worker process needs to read the page with read_page
+    def ref(self, name):
+        return self.key(name)
+
+    # The order in which the pages are read fastest. Loose files have no order of their own.
+    def in_read_order(self, names):
+        return list(names)
+
+    # Returns the cached features of the page, or None if it is new or has changed
+    def cache_lookup(self, cache, name):
+        return cache.lookup(self.key(name))
+
+    def cache_store(self, cache, name, file_hash, features):
+        cache.store(self.key(name), file_hash, features)
+
+    def close(self):
+        pass
+
+# The saved pages of one kind as zlib compressed records appended to a single pack file, with an index from
+# page name to the position of its latest record. Pages are read through a memory map of the pack file.
+class OspPagePack:
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.path = os.path.join(directory, PACK_FILE)
+        os.makedirs(directory, exist_ok=True)
+        # The downloader writes from its worker threads
+        self.index = sqlite3.connect(os.path.join(directory, INDEX_FILE), check_same_thread=False)
+        self.lock = threading.Lock()
+        self.index.execute('''
+            CREATE TABLE IF NOT EXISTS pages (
+                name TEXT PRIMARY KEY,
+                offset INTEGER NOT NULL,
+                length INTEGER NOT NULL,
+                hash TEXT NOT NULL
+            )''')
+
+    def key(self, name):
+        return os.path.join(self.directory, name)
+
+    def contains(self, name):
+        with self.lock:
+            return self.index.execute('SELECT 1 FROM pages WHERE name = ?', (name,)).fetchone() is not None
+
+    def __len__(self):
+        return self.index.execute('SELECT COUNT(*) FROM pages').fetchone()[0]
+
+    # Appends the page. An earlier record with the same name stays in the pack but is no longer indexed.
+    def put(self, name, content):
+        self.append_record(name, zlib.compress(content, COMPRESSION_LEVEL), content_hash(decode_text(content)))
+
+    # Appends the compressed record of a page as it is stored in another pack, without decompressing it
+    def copy_record(self, pack, name):
+        offset, length, page_hash = pack.get_record(name)
+        with open(pack.path, 'rb') as f:
+            f.seek(offset)
+            data = f.read(length)
+        self.append_record(name, data, page_hash)
+
+    def append_record(self, name, data, page_hash):
+        encoded_name = name.encode('utf-8')
+        with self.lock:
+            with open(self.path, 'ab') as f:
+                offset = f.tell() + RECORD_HEADER.size + len(encoded_name)
+                f.write(RECORD_HEADER.pack(RECORD_MAGIC, len(encoded_name), len(data)) + encoded_name + data)
+
+            self.index.execute('INSERT OR REPLACE INTO pages VALUES (?, ?, ?, ?)', (name, offset, len(data), page_hash))
+            self.index.commit()
+
+    def get_record(self, name):
+        with self.lock:
+            return self.index.execute('SELECT offset, length, hash FROM pages WHERE name = ?', (name,)).fetchone()
+
+    def read(self, name):
+        offset, length, page_hash = self.get_record(name)
+        return read_page(self.ref(name, offset, length))
+
+    # The page as it was downloaded, before decoding and normalizing the line ends
+    def read_bytes(self, name):
+        offset, length, page_hash = self.get_record(name)
+        with open(self.path, 'rb') as f:
+            f.seek(offset)
+            return zlib.decompress(f.read(length))
+
+    def names(self):
+        with self.lock:
+            return [row[0] for row in self.index.execute('SELECT name FROM pages ORDER BY name')]
+
+    def ref(self, name, offset = None, length = None):
+        if offset is None:
+            offset, length, page_hash = self.get_record(name)
+        return (self.path, offset, length)
+
+    # Sorted by the position in the pack, so that the workers read the memory map sequentially
+    def in_read_order(self, names):
+        with self.lock:
+            offsets = dict(self.index.execute('SELECT name, offset FROM pages'))
+        return sorted(names, key=lambda name: offsets[name])
+
+    # The index knows the content hash, so unchanged pages are found without reading them
+    def cache_lookup(self, cache, name):
+        offset, length, page_hash = self.get_record(name)
+        return cache.lookup_hash(self.key(name), page_hash)
+
+    def cache_store(self, cache, name, file_hash, features):
+        cache.store_hash(self.key(name), file_hash, features)
+
+    # Yields (name, content) for every indexed page as it was downloaded, in the order of the pack file
+    def iter_pages(self):
+        with self.lock:
+            rows = self.index.execute('SELECT name, offset, length FROM pages ORDER BY offset').fetchall()
+        with open(self.path, 'rb') as f:
+            for name, offset, length in rows:
+                f.seek(offset)
+                yield name, zlib.decompress(f.read(length))
+
+    # Writes every page back out as a loose .html file with the bytes that were downloaded
+    def export_directory(self, directory):
+        os.makedirs(directory, exist_ok=True)
+        exported = 0
+        for name, content in self.iter_pages():
+            with open(os.path.join(directory, name), 'wb') as f:
+                f.write(content)
+            exported += 1
+            print('Exported', exported, 'pages', end='\r')
+
+        print('Exported', exported, 'pages')
+        return exported
+
+    # Imports the loose .html files of a directory
+    def import_directory(self, directory):
+        imported = 0
+        for name in sorted(os.listdir(directory)):
+            if not name.endswith('.html'):
+                continue
+            with open(os.path.join(directory, name), 'rb') as f:
+                self.put(name, f.read())
+            imported += 1
+            print('Imported', imported, 'pages', end='\r')
+
+        print('Imported', imported, 'pages')
+        return imported
+
+    def close(self):
+        self.index.close()
+
+def open_page_store(storage, directory, pack_directory):
+    if storage not in STORAGE_MODES:
+        raise ValueError('Unknown storage ' + str(storage) + ', expected one of ' + ', '.join(STORAGE_MODES))
+    if storage == 'pack':
+        return OspPagePack(pack_directory)
+    return OspPageFiles(directory)
+
+# Copies the pages kept from each shard's pack (see OspShardMerge) into pages. Shards that saved loose files
+# have already written them to the shared directory.
+def merge_shard_packs(merge, pages, pack_directory):
+    for shard in merge.shards:
+        directory = shard.name(pack_directory)
+        if not os.path.isdir(directory):
+            continue
+        pack = OspPagePack(directory)
+        copied = 0
+        for name in merge.sources_of(shard):
+            if not pack.contains(name):
+                continue
+            if isinstance(pages, OspPagePack):
+                pages.copy_record(pack, name)
+            else:
+                pages.put(name, pack.read_bytes(name))
+            copied += 1
+        pack.close()
+        print('Copied', copied, 'pages from shard', shard)
+
+# Memory maps of the pack files, kept open for the lifetime of the (worker) process
+pack_maps = {}
+
+# Runs in a worker process. Returns the text of a page, given a path of a loose file or a (pack, offset, length) tuple.
+def read_page(ref):
+    if isinstance(ref, str):
+        return read_text(ref)
+
+    path, offset, length = ref
+    pack_map = pack_maps.get(path)
+    if pack_map is None or offset + length > len(pack_map):
+        # Not mapped yet, or the pack has grown since it was mapped
+        if pack_map is not None:
+            pack_map.close()
+        with open(path, 'rb') as f:
+            pack_map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        pack_maps[path] = pack_map
+    return decode_text(zlib.decompress(pack_map[offset:offset + length]))
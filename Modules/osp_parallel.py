@@ -0,0 +1,16 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+# Applies func to every item in a pool of worker processes. Results are yielded in the order of items.
+# func must be a module level function so that it can be sent to the workers.
+def parallel_map(func, items, workers = None):
+    workers = workers or os.cpu_count() or 1
+    if workers == 1:
+        for item in items:
+            yield func(item)
+        return
+
+    # Hand out the files in chunks so that the workers do not wait for the parent after every file
+    chunksize = max(len(items) // (workers * 4), 1)
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        yield from executor.map(func, items, chunksize=chunksize)
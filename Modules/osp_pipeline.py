@@ -0,0 +1,41 @@
+import os
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+PIPELINE_QUEUE_SIZE = 64
+
+# Hands downloaded pages straight to parser worker processes while the crawl goes on.
+# At most queue_size pages wait for a parser at a time; when the parsers fall behind, the downloaders block.
+class OspPipeline:
+
+    def __init__(self, parse_func, workers = None, queue_size = PIPELINE_QUEUE_SIZE):
+        self.parse_func = parse_func
+        # The first submit comes from a download thread while the others are in the middle of requests. Forking
+        # a process with running threads can deadlock the child, so the workers are started from a clean process.
+        start_method = 'forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else 'spawn'
+        self.executor = ProcessPoolExecutor(max_workers=workers or os.cpu_count() or 1, mp_context=multiprocessing.get_context(start_method))
+        self.slots = threading.BoundedSemaphore(queue_size)
+        self.futures = {}
+        self.lock = threading.Lock()
+
+    # Queues a page for parsing. parse_func is called with task (the page text, or a tuple with it) in a worker process.
+    def submit(self, key, task):
+        self.slots.acquire()
+        future = self.executor.submit(self.parse_func, task)
+        future.add_done_callback(lambda future: self.slots.release())
+        with self.lock:
+            self.futures[key] = future
+
+    def __contains__(self, key):
+        with self.lock:
+            return key in self.futures
+
+    # Waits for all parsers and returns the keys and the results, sorted by key
+    def results(self):
+        keys = sorted(self.futures)
+        results = [self.futures[key].result() for key in keys]
+        return keys, results
+
+    def close(self):
+        self.executor.shutdown()
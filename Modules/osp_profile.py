@@ -0,0 +1,105 @@
+import os
+import sys
+import time
+import runpy
+import pstats
+import cProfile
+import argparse
+import threading
+from collections import Counter
+
+from Modules.osp_metrics import METRICS_DIR
+
+SAMPLING_INTERVAL = 0.005
+TOP_ENTRIES = 30
+
+# Samples the stacks of all threads at a fixed interval. Unlike cProfile it adds almost no overhead, and it also
+# shows where the download threads wait. Worker processes of the analyses are not sampled, only the main process.
+class StackSampler:
+
+    def __init__(self, interval = SAMPLING_INTERVAL):
+        self.interval = interval
+        self.stacks = Counter() # Collapsed stacks, in the format flame graph tools read
+        self.functions = Counter() # Innermost function of every sample
+        self.samples = 0
+        self.running = False
+        self.thread = threading.Thread(target=self.sample, daemon=True)
+
+    def start(self):
+        self.running = True
+        self.thread.start()
+
+    def stop(self):
+        self.running = False
+        self.thread.join()
+
+    def sample(self):
+        own_id = threading.get_ident()
+        while self.running:
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_id:
+                    continue
+                stack = []
+                while frame is not None:
+                    stack.append(frame.f_code.co_name + ' (' + os.path.basename(frame.f_code.co_filename) + ':' + str(frame.f_code.co_firstlineno) + ')')
+                    frame = frame.f_back
+                self.functions[stack[0]] += 1
+                self.stacks[';'.join(reversed(stack))] += 1
+                self.samples += 1
+            time.sleep(self.interval)
+
+    def write(self, path):
+        with open(path, 'w', encoding='utf-8') as f:
+            for stack, count in self.stacks.most_common():
+                f.write(stack + ' ' + str(count) + '\n')
+
+    def print_top(self, top = TOP_ENTRIES):
+        print('Innermost functions of', self.samples, 'samples:')
+        for function, count in self.functions.most_common(top):
+            print('  %6.1f %%  %s' % (count * 100 / self.samples, function))
+
+# Runs the script as if it was started directly, with the given command line arguments
+def run_script(script, args):
+    sys.argv = [script] + args
+    sys.path.insert(0, os.path.dirname(os.path.abspath(script)))
+    runpy.run_path(script, run_name='__main__')
+
+def profile_script(script, args, sampling = False, interval = SAMPLING_INTERVAL, output = None):
+    name = os.path.splitext(os.path.basename(script))[0]
+    os.makedirs(METRICS_DIR, exist_ok=True)
+
+    if sampling:
+        output = output or os.path.join(METRICS_DIR, name + '.stacks')
+        sampler = StackSampler(interval)
+        sampler.start()
+        try:
+            run_script(script, args)
+        finally:
+            sampler.stop()
+            sampler.write(output)
+            sampler.print_top()
+            print('Saved the collapsed stacks to', output)
+        return
+
+    output = output or os.path.join(METRICS_DIR, name + '.prof')
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        run_script(script, args)
+    finally:
+        profiler.disable()
+        profiler.dump_stats(output)
+        pstats.Stats(output).sort_stats('cumulative').print_stats(TOP_ENTRIES)
+        print('Saved the profile to', output)
+
+# python -m Modules.osp_profile [--sampling] script.py [script arguments]
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Run an entry script under cProfile or a sampling profiler')
+    parser.add_argument('--sampling', action='store_true', help='sample the stacks of all threads instead of tracing every call')
+    parser.add_argument('--interval', type=float, default=SAMPLING_INTERVAL, help='seconds between samples')
+    parser.add_argument('--output', default=None, help='profile file, defaults to outputs/metrics/<script>.prof or .stacks')
+    parser.add_argument('script')
+    parser.add_argument('args', nargs=argparse.REMAINDER)
+    args = parser.parse_args()
+
+    profile_script(args.script, args.args, args.sampling, args.interval, args.output)
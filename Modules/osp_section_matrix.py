@@ -0,0 +1,63 @@
+import sys
+
+import numpy as np
+
+# Section lengths of all metadata pages as a files x section titles matrix, with a mask of which sections exist
+class OspSectionMatrix:
+
+    def __init__(self, section_length_data, section_content_data, filenames):
+        self.filenames = filenames
+        self.section_content_data = section_content_data
+        self.titles = [] # In order of first appearance, like the grouping used to be
+        self.columns = {}
+
+        rows = []
+        columns = []
+        values = []
+        for row, section_lengths in enumerate(section_length_data):
+            for section_title, section_length in section_lengths.items():
+                column = self.columns.get(section_title)
+                if column is None:
+                    column = len(self.titles)
+                    section_title = sys.intern(section_title)
+                    self.columns[section_title] = column
+                    self.titles.append(section_title)
+                rows.append(row)
+                columns.append(column)
+                values.append(section_length)
+
+        self.lengths = np.zeros((len(filenames), len(self.titles)), dtype=np.int64)
+        self.present = np.zeros((len(filenames), len(self.titles)), dtype=bool)
+        self.lengths[rows, columns] = values
+        self.present[rows, columns] = True
+
+    # Lengths of the section in every file, 0 where the file does not have it
+    def get_lengths(self, section_title):
+        return self.lengths[:, self.columns[section_title]]
+
+    # Rows of files that lack the section, and rows of files where it has at most empty_threshold characters
+    def find_empty(self, section_title, empty_threshold):
+        column = self.columns[section_title]
+        present = self.present[:, column]
+        return ~present, present & (self.lengths[:, column] <= empty_threshold)
+
+    # Number of files with the section, without it, with it empty, and the mean and maximum length where it exists
+    def get_statistics(self, empty_threshold):
+        present_counts = self.present.sum(axis=0)
+        empty_counts = (self.present & (self.lengths <= empty_threshold)).sum(axis=0)
+        length_sums = self.lengths.sum(axis=0)
+        max_lengths = self.lengths.max(axis=0, initial=0)
+
+        statistics = {}
+        for column, section_title in enumerate(self.titles):
+            statistics[section_title] = {
+                'present': int(present_counts[column]),
+                'missing': len(self.filenames) - int(present_counts[column]),
+                'empty': int(empty_counts[column]),
+                'mean_length': length_sums[column] / present_counts[column] if present_counts[column] else 0,
+                'max_length': int(max_lengths[column]),
+            }
+        return statistics
+
+    def get_content(self, row, section_title):
+        return self.section_content_data[row][section_title]
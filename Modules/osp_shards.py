@@ -0,0 +1,153 @@
+import os
+import json
+import hashlib
+from datetime import datetime
+
+from Modules.osp_manifest import OspManifest
+
+SHARD_DIR = 'outputs/shards'
+
+# Shard (1 to count) of a data set. It is derived from a hash of the name instead of Python's hash(), so that
+# every node and every run assigns a data set to the same shard.
+def shard_of(dataset, count):
+    return int(hashlib.sha1(dataset.encode('utf-8')).hexdigest()[:8], 16) % count + 1
+
+# Parses k/N, e.g. 2/4 for the second of four shards
+def parse_shard(value):
+    try:
+        index, count = (int(part) for part in value.split('/'))
+    except ValueError:
+        raise ValueError('Expected the shard as k/N, e.g. 2/4, not ' + value)
+    return OspShard(index, count)
+
+# The name of a manifest, journal or store, or its shard's variant when the crawl is sharded
+def shard_name(name, shard):
+    return name if shard is None else shard.name(name)
+
+# Shard k of N of a crawl. Each shard downloads the data sets whose name hashes to it, so that N processes
+# or nodes can split one crawl without coordinating.
+class OspShard:
+
+    def __init__(self, index, count):
+        if count < 1 or not 1 <= index <= count:
+            raise ValueError('There is no shard ' + str(index) + '/' + str(count) + ', k must be between 1 and N')
+        self.index = index
+        self.count = count
+
+    def __str__(self):
+        return '%d/%d' % (self.index, self.count)
+
+    def contains(self, dataset):
+        return shard_of(dataset, self.count) == self.index
+
+    def select(self, items, get_dataset):
+        return [item for item in items if self.contains(get_dataset(item))]
+
+    # e.g. dataset_pages.shard-2-of-4 or category_cache.shard-2-of-4.json. Every shard writes its own manifest,
+    # journal and stores, so that several shards can share an outputs directory.
+    def name(self, name):
+        root, extension = os.path.splitext(name)
+        return root + '.shard-%d-of-%d' % (self.index, self.count) + extension
+
+    def get_assignment_path(self, name):
+        return os.path.join(SHARD_DIR, self.name(name) + '.json')
+
+    # Records which of the listed data sets belong to the shard, so that the merge can tell which are missing
+    def save_assignment(self, name, datasets, listed):
+        os.makedirs(SHARD_DIR, exist_ok=True)
+        path = self.get_assignment_path(name)
+        with open(path + '.tmp', 'w', encoding='utf-8') as f:
+            json.dump({
+                'shard': self.index,
+                'count': self.count,
+                'listed': listed,
+                'saved_at': datetime.now().isoformat(timespec='seconds'),
+                'datasets': datasets,
+            }, f, indent=4, ensure_ascii=False)
+        os.replace(path + '.tmp', path)
+
+# Combines what the shards of a crawl downloaded into one corpus: the manifests of the shards
+# are merged into the unsharded one, and the stores are copied by the analyzers using sources_of.
+# report lists the data sets missing from the corpus and those that more than one shard downloaded.
+class OspShardMerge:
+
+    def __init__(self, name, count):
+        self.name = name
+        self.shards = [OspShard(index, count) for index in range(1, count + 1)]
+        self.assignments = {} # Shard index -> data sets the shard was assigned
+        self.listed = set() # Sizes of the listings the shards saw
+        self.missing_shards = []
+        self.owners = {} # Data set -> shards that downloaded it
+        self.sources = {} # Data set -> shard whose copy is kept
+
+        for shard in self.shards:
+            path = shard.get_assignment_path(name)
+            if not os.path.isfile(path):
+                self.missing_shards.append(shard)
+                continue
+            with open(path, 'r', encoding='utf-8') as f:
+                assignment = json.load(f)
+            self.assignments[shard.index] = assignment['datasets']
+            self.listed.add(assignment['listed'])
+
+    # Copies the records of the shard manifests into manifest. Of a data set that more than one shard
+    # downloaded, the most recently fetched copy is kept.
+    def merge_manifests(self, manifest):
+        fetched = {}
+        for shard in self.shards:
+            for dataset, record in OspManifest(shard.name(self.name)).records.items():
+                self.owners.setdefault(dataset, []).append(shard.index)
+                if dataset not in fetched or (record.get('fetched_at') or '') >= fetched[dataset]:
+                    fetched[dataset] = record.get('fetched_at') or ''
+                    manifest.records[dataset] = record
+                    self.sources[dataset] = shard
+        manifest.save()
+        print('Merged the manifests of', len(self.shards) - len(self.missing_shards), '/', len(self.shards), 'shards with', len(self.sources), 'data sets')
+
+    # The data sets whose kept copy comes from the shard
+    def sources_of(self, shard):
+        return sorted(dataset for dataset, source in self.sources.items() if source is shard)
+
+    # Prints and saves which assigned data sets the corpus lacks (contains tells if it has a data set) and which
+    # data sets more than one shard was assigned or downloaded. Returns both lists. The data sets of a shard that
+    # has not run are unknown, so the shard itself is listed as missing, e.g. 'shard 2/4'.
+    def report(self, contains):
+        shards_of = {dataset: set(indices) for dataset, indices in self.owners.items()}
+        for index, datasets in self.assignments.items():
+            for dataset in datasets:
+                shards_of.setdefault(dataset, set()).add(index)
+
+        assigned = {dataset for datasets in self.assignments.values() for dataset in datasets}
+        missing_datasets = sorted(dataset for dataset in assigned if not contains(dataset))
+        missing = missing_datasets + ['shard ' + str(shard) for shard in self.missing_shards]
+        duplicates = {dataset: sorted(indices) for dataset, indices in sorted(shards_of.items()) if len(indices) > 1}
+
+        # The shards that ran saw how many data sets there are in all
+        listed = max(self.listed) if self.listed else None
+        unaccounted = max(listed - len(assigned), 0) if listed is not None else None
+
+        if len(self.listed) > 1:
+            print('Warning: The shards saw table listings of different sizes:', ', '.join(str(size) for size in sorted(self.listed)))
+        for dataset in missing_datasets:
+            print('Missing:', dataset)
+        for shard in self.missing_shards:
+            print('Missing: shard', shard, 'has not run')
+        for dataset, indices in duplicates.items():
+            print('Duplicate:', dataset, 'in shards', ', '.join(str(index) for index in indices))
+        if listed is None:
+            print('No shard has run')
+        else:
+            print(len(assigned) - len(missing_datasets), '/', listed, 'listed data sets are in the corpus,', len(missing_datasets), 'missing,', unaccounted, 'unaccounted for in', len(self.missing_shards), 'shards that have not run,', len(duplicates), 'duplicates')
+
+        os.makedirs(SHARD_DIR, exist_ok=True)
+        with open(os.path.join(SHARD_DIR, self.name + '-merge.json'), 'w', encoding='utf-8') as f:
+            json.dump({
+                'shards': len(self.shards),
+                'missing_shards': [shard.index for shard in self.missing_shards],
+                'listed': listed,
+                'assigned': len(assigned),
+                'unaccounted': unaccounted,
+                'missing': missing,
+                'duplicates': duplicates,
+            }, f, indent=4, ensure_ascii=False)
+        return missing, duplicates
@@ -0,0 +1,105 @@
+import os
+import json
+import sqlite3
+import threading
+
+TABLE_STORE_DIR = 'outputs/table_store'
+INDEX_FILE = 'index.sqlite'
+SEGMENT_SIZE = 64 * 1024 * 1024
+
+# Consolidated store for the tables read from the API. Tables are appended as JSON lines to a few large
+# segment files, and an index maps every table name to the position of its latest record.
+class OspTableStore:
+
+    def __init__(self, directory = TABLE_STORE_DIR):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+        # The downloader checks the index from its worker threads
+        self.index = sqlite3.connect(os.path.join(directory, INDEX_FILE), check_same_thread=False)
+        self.lock = threading.Lock()
+        self.index.execute('''
+            CREATE TABLE IF NOT EXISTS tables (
+                name TEXT PRIMARY KEY,
+                segment INTEGER NOT NULL,
+                offset INTEGER NOT NULL,
+                length INTEGER NOT NULL
+            )''')
+        self.segment = self.index.execute('SELECT COALESCE(MAX(segment), 0) FROM tables').fetchone()[0]
+
+    def get_segment_path(self, segment):
+        return os.path.join(self.directory, 'segment-%05d.jsonl' % segment)
+
+    def contains(self, name):
+        with self.lock:
+            return self.index.execute('SELECT 1 FROM tables WHERE name = ?', (name,)).fetchone() is not None
+
+    def __len__(self):
+        return self.index.execute('SELECT COUNT(*) FROM tables').fetchone()[0]
+
+    # Appends the table. An earlier record with the same name stays in its segment but is no longer indexed.
+    def put(self, name, table):
+        line = (json.dumps({'name': name, 'table': table}, ensure_ascii=False) + '\n').encode('utf-8')
+
+        with self.lock:
+            path = self.get_segment_path(self.segment)
+            if os.path.isfile(path) and os.path.getsize(path) + len(line) > SEGMENT_SIZE:
+                self.segment += 1
+                path = self.get_segment_path(self.segment)
+
+            with open(path, 'ab') as f:
+                offset = f.tell()
+                f.write(line)
+
+            self.index.execute('INSERT OR REPLACE INTO tables VALUES (?, ?, ?, ?)', (name, self.segment, offset, len(line)))
+            self.index.commit()
+
+    def get(self, name):
+        with self.lock:
+            row = self.index.execute('SELECT segment, offset, length FROM tables WHERE name = ?', (name,)).fetchone()
+        if row is None:
+            return None
+
+        segment, offset, length = row
+        with open(self.get_segment_path(segment), 'rb') as f:
+            f.seek(offset)
+            return json.loads(f.read(length))['table']
+
+    # Yields (name, table) for every indexed table, reading the segments sequentially
+    def iter_tables(self):
+        segment = None
+        f = None
+        try:
+            for name, record_segment, offset, length in self.index.execute('SELECT name, segment, offset, length FROM tables ORDER BY segment, offset'):
+                if record_segment != segment:
+                    if f is not None:
+                        f.close()
+                    segment = record_segment
+                    f = open(self.get_segment_path(segment), 'rb')
+                f.seek(offset)
+                yield name, json.loads(f.read(length))['table']
+        finally:
+            if f is not None:
+                f.close()
+
+    # Yields a dict with only the requested fields of each table's first metadata entry. Missing fields are left out.
+    def iter_metadata(self, fields):
+        for name, table in self.iter_tables():
+            metadata = table['table']['metadata'][0]
+            yield {field: metadata[field] for field in fields if field in metadata}
+
+    # Imports the tables saved as separate JSON files (the old outputs/tables layout)
+    def import_directory(self, directory):
+        imported = 0
+        for filename in sorted(os.listdir(directory)):
+            if not filename.endswith('.json'):
+                continue
+            with open(os.path.join(directory, filename), 'r', encoding='utf-8') as f:
+                self.put(filename[:-len('.json')], json.load(f))
+            imported += 1
+            print('Imported', imported, 'JSON files', end='\r')
+
+        print('Imported', imported, 'JSON files')
+        return imported
+
+    def close(self):
+        self.index.close()
@@ -1,4 +1,5 @@
 from Modules.osp_date_analyzer import OspDateAnalyzer
 
-ospGuiAnalyzer = OspDateAnalyzer()
-ospGuiAnalyzer.analyze_date_data()
\ No newline at end of file
+if __name__ == '__main__':
+    ospGuiAnalyzer = OspDateAnalyzer()
+    ospGuiAnalyzer.analyze_date_data()
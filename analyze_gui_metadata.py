@@ -1,4 +1,5 @@
 from Modules.osp_gui_analyzer import OspGuiAnalyzer
 
-ospGuiAnalyzer = OspGuiAnalyzer()
-ospGuiAnalyzer.analyze_metadata()
\ No newline at end of file
+if __name__ == '__main__':
+    ospGuiAnalyzer = OspGuiAnalyzer()
+    ospGuiAnalyzer.analyze_metadata()
@@ -0,0 +1,5 @@
+from Modules.osp_gui_analyzer import OspGuiAnalyzer
+
+if __name__ == '__main__':
+    ospGuiAnalyzer = OspGuiAnalyzer()
+    ospGuiAnalyzer.analyze_metadata_all_levels()
@@ -0,0 +1,210 @@
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import platform
+import tempfile
+import contextlib
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pyscbwrapper
+from pyscbwrapper import SCB
+
+from Modules import osp_date_analyzer, osp_gui_analyzer, osp_api_analyzer, osp_crawl_analyzer
+from Modules.osp_crawler import OspCrawler
+from Modules.osp_date_analyzer import OspDateAnalyzer
+from Modules.osp_gui_analyzer import OspGuiAnalyzer
+from Modules.osp_api_analyzer import OspApiAnalyzer
+from benchmarks.stand_in_server import StandInServer
+
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'results')
+OUTPUT_DIRS = ['dataset_pages', 'dataset_diagrams', 'metadata_pages', 'metadata_diagrams', 'table_diagrams']
+SIZES = [100, 1000, 10000]
+
+# Benchmarked passes in the order they run. Every download pass is followed by the analysis of what it
+# downloaded; the second download of each kind measures an incremental re-crawl.
+PASSES = [
+    ('read_date_pages', lambda options, workers: OspDateAnalyzer(**options).read_date_pages()),
+    ('read_date_pages_incremental', lambda options, workers: OspDateAnalyzer(**options).read_date_pages()),
+    ('analyze_date_data', lambda options, workers: OspDateAnalyzer(**options).analyze_date_data(workers)),
+    ('analyze_date_data_cached', lambda options, workers: OspDateAnalyzer(**options).analyze_date_data(workers)),
+    ('read_metadata', lambda options, workers: OspGuiAnalyzer(**options).read_metadata()),
+    ('read_metadata_incremental', lambda options, workers: OspGuiAnalyzer(**options).read_metadata()),
+    # Without the cache, so that the two single-level passes parse every page and leave the cache to the passes below
+    ('analyze_metadata', lambda options, workers: OspGuiAnalyzer(**options).analyze_metadata(False, workers, use_cache=False)),
+    ('analyze_metadata_subsections', lambda options, workers: OspGuiAnalyzer(**options).analyze_metadata(True, workers, use_cache=False)),
+    ('analyze_metadata_all_levels', lambda options, workers: OspGuiAnalyzer(**options).analyze_metadata_all_levels(workers)),
+    ('analyze_metadata_all_levels_cached', lambda options, workers: OspGuiAnalyzer(**options).analyze_metadata_all_levels(workers)),
+    ('read_tables_from_api', lambda options, workers: OspApiAnalyzer(**options).read_tables_from_api()),
+    ('read_tables_from_listing', lambda options, workers: OspApiAnalyzer(**dict(options, incremental=False)).read_tables_from_listing()),
+    ('evaluate_metadata', lambda options, workers: OspApiAnalyzer(**options).evaluate_metadata()),
+]
+
+# Collects the time to the response headers of every HTTP request, from the crawler sessions and pyscbwrapper's
+class LatencyRecorder:
+
+    def __init__(self):
+        self.latencies = []
+
+    def hook(self, response, *args, **kwargs):
+        self.latencies.append(response.elapsed.total_seconds())
+
+    def summary(self):
+        if not self.latencies:
+            return {'requests': 0}
+        latencies = sorted(self.latencies)
+        return {
+            'requests': len(latencies),
+            'latency_mean': sum(latencies) / len(latencies),
+            'latency_p50': latencies[len(latencies) // 2],
+            'latency_p95': latencies[min(int(len(latencies) * 0.95), len(latencies) - 1)],
+            'latency_max': latencies[-1],
+        }
+
+# Points the analyzers and pyscbwrapper at the stand-in server and records the latency of every request
+@contextlib.contextmanager
+def use_stand_in(server, recorder):
+    saved = {
+        (osp_date_analyzer, 'ALL_TABLES_URL'): osp_date_analyzer.ALL_TABLES_URL,
+        (osp_date_analyzer, 'TABLE_URL_BASE'): osp_date_analyzer.TABLE_URL_BASE,
+        (osp_gui_analyzer, 'ALL_TABLES_URL'): osp_gui_analyzer.ALL_TABLES_URL,
+        (osp_gui_analyzer, 'TABLE_URL_BASE'): osp_gui_analyzer.TABLE_URL_BASE,
+        (osp_api_analyzer, 'ALL_TABLES_URL'): osp_api_analyzer.ALL_TABLES_URL,
+        (osp_api_analyzer, 'SCB'): osp_api_analyzer.SCB,
+    }
+    # The crawls create their crawler in osp_crawl_analyzer, the listing validation in osp_api_analyzer
+    for module in (osp_crawl_analyzer, osp_api_analyzer):
+        saved[(module, 'OspCrawler')] = module.OspCrawler
+
+    class StandInSCB(SCB):
+        def __init__(self, lang, *args):
+            super().__init__(lang, *args)
+            self.url = server.api_url
+
+    class RecordedCrawler(OspCrawler):
+        def __init__(self, *args, **kwargs):
+            super().__init__(*args, **kwargs)
+            self.session.hooks['response'].append(recorder.hook)
+
+    for module in (osp_date_analyzer, osp_gui_analyzer, osp_api_analyzer):
+        module.ALL_TABLES_URL = server.all_tables_url
+    for module in (osp_crawl_analyzer, osp_api_analyzer):
+        module.OspCrawler = RecordedCrawler
+    osp_date_analyzer.TABLE_URL_BASE = server.table_url_base
+    osp_gui_analyzer.TABLE_URL_BASE = server.table_url_base
+    osp_api_analyzer.SCB = StandInSCB
+    pyscbwrapper.session.hooks['response'].append(recorder.hook)
+
+    try:
+        yield
+    finally:
+        for (module, name), value in saved.items():
+            setattr(module, name, value)
+        pyscbwrapper.session.hooks['response'].remove(recorder.hook)
+
+def run_pass(name, run, options, workers, server, verbose):
+    recorder = LatencyRecorder()
+    requests_before = server.requests
+    errors_before = server.errors
+
+    with use_stand_in(server, recorder), contextlib.ExitStack() as stack:
+        if not verbose:
+            stack.enter_context(contextlib.redirect_stdout(stack.enter_context(open(os.devnull, 'w', encoding='utf-8'))))
+        start = time.perf_counter()
+        run(options, workers)
+        seconds = time.perf_counter() - start
+
+    result = {
+        'pass': name,
+        'datasets': server.datasets,
+        'seconds': seconds,
+        'datasets_per_second': server.datasets / seconds if seconds else None,
+        'server_requests': server.requests - requests_before,
+        'server_errors': server.errors - errors_before,
+    }
+    result.update(recorder.summary())
+    return result
+
+# Runs all passes for every size in a fresh working directory and returns the results
+def run_benchmarks(sizes, passes, latency, error_rate, page_size, concurrency, workers, verbose = False):
+    results = []
+    start_dir = os.getcwd()
+
+    for size in sizes:
+        server = StandInServer(size, latency, error_rate, page_size).start()
+        work_dir = tempfile.mkdtemp(prefix='osp_benchmark_')
+        os.chdir(work_dir)
+        for output_dir in OUTPUT_DIRS:
+            os.makedirs(os.path.join('outputs', output_dir), exist_ok=True)
+
+        # No sleep and no rate cap, so that the benchmark measures the code and the stand-in's latency
+        options = {'table_limit': size, 'sleep_time': 0, 'concurrency': concurrency, 'chart_mode': 'pdf'}
+        try:
+            for name, run in PASSES:
+                if name not in passes:
+                    continue
+                result = run_pass(name, run, options, workers, server, verbose)
+                print('%6d data sets  %-36s %8.2f s  %8.1f data sets/s  %6d requests' % (size, name, result['seconds'], result['datasets_per_second'] or 0, result['server_requests']))
+                results.append(result)
+        finally:
+            os.chdir(start_dir)
+            shutil.rmtree(work_dir, ignore_errors=True)
+            server.stop()
+
+    return results
+
+# Prints the passes that got slower by more than threshold (e.g. 0.2 for 20 %) compared with a previous result file
+def compare_results(results, baseline_path, threshold):
+    with open(baseline_path, 'r', encoding='utf-8') as f:
+        baseline = {(result['pass'], result['datasets']): result for result in json.load(f)['results']}
+
+    regressions = 0
+    for result in results:
+        previous = baseline.get((result['pass'], result['datasets']))
+        if previous is None or not previous['seconds']:
+            continue
+        change = result['seconds'] / previous['seconds'] - 1
+        if change > threshold:
+            regressions += 1
+            print('Regression:', result['pass'], 'with', result['datasets'], 'data sets took', round(change * 100), '% longer (', round(previous['seconds'], 2), 's ->', round(result['seconds'], 2), 's)')
+
+    print(regressions, 'regressions compared with', baseline_path)
+    return regressions
+
+if __name__ == '__main__':
+    pass_names = [name for name, run in PASSES]
+    parser = argparse.ArgumentParser(description='Benchmark the downloaders and analyses against a local stand-in for data.stat.gov.lv')
+    parser.add_argument('--sizes', type=int, nargs='+', default=SIZES, help='numbers of data sets to benchmark with')
+    parser.add_argument('--passes', nargs='+', default=pass_names, choices=pass_names, metavar='PASS', help='passes to run: ' + ', '.join(pass_names))
+    parser.add_argument('--latency', type=float, default=0.01, help='seconds the stand-in adds to every response')
+    parser.add_argument('--error-rate', type=float, default=0, help='share of requests the stand-in answers with 503')
+    parser.add_argument('--page-size', type=int, default=30000, help='size of the HTML pages in characters')
+    parser.add_argument('--concurrency', type=int, default=8, help='download threads')
+    parser.add_argument('--workers', type=int, default=None, help='analysis worker processes, defaults to the number of cores')
+    parser.add_argument('--output', default=None, help='result file, defaults to benchmarks/results/<timestamp>.json')
+    parser.add_argument('--baseline', default=None, help='earlier result file to compare with')
+    parser.add_argument('--threshold', type=float, default=0.2, help='slowdown reported as a regression, 0.2 is 20 %%')
+    parser.add_argument('--verbose', action='store_true', help='show the output of the analyzers')
+    args = parser.parse_args()
+
+    results = run_benchmarks(args.sizes, args.passes, args.latency, args.error_rate, args.page_size, args.concurrency, args.workers, args.verbose)
+
+    output = args.output or os.path.join(RESULTS_DIR, datetime.now().strftime('%Y%m%d-%H%M%S') + '.json')
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w', encoding='utf-8') as f:
+        json.dump({
+            'created': datetime.now().isoformat(timespec='seconds'),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count(),
+            'settings': {key: value for key, value in vars(args).items() if key not in ('output', 'baseline', 'verbose')},
+            'results': results,
+        }, f, indent=4)
+    print('Saved results to', output)
+
+    if args.baseline:
+        compare_results(results, args.baseline, args.threshold)
@@ -0,0 +1,84 @@
+import os
+import sys
+import time
+import shutil
+import argparse
+import tempfile
+import contextlib
+import multiprocessing
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from Modules.osp_shards import OspShard
+from Modules.osp_date_analyzer import OspDateAnalyzer
+from Modules.osp_gui_analyzer import OspGuiAnalyzer
+from Modules.osp_api_analyzer import OspApiAnalyzer
+from benchmarks.stand_in_server import StandInServer
+from benchmarks.run_benchmarks import LatencyRecorder, use_stand_in, OUTPUT_DIRS
+
+KINDS = {
+    'dataset': (OspDateAnalyzer, lambda analyzer: analyzer.read_date_pages()),
+    'metadata': (OspGuiAnalyzer, lambda analyzer: analyzer.read_metadata()),
+    'tables': (OspApiAnalyzer, lambda analyzer: analyzer.read_tables_from_listing()),
+}
+
+# Runs in its own process, like a shard on another node, but in the shared working directory
+def run_shard(kind, index, count, urls, options):
+    analyzer_class, read = KINDS[kind]
+    with open(os.devnull, 'w', encoding='utf-8') as devnull, contextlib.redirect_stdout(devnull):
+        with use_stand_in(urls, LatencyRecorder()):
+            read(analyzer_class(shard=OspShard(index, count), **options))
+
+# Crawls the stand-in with count shard processes at the same time, merges their outputs and returns the merge report
+def run_shards(kind, datasets, count, storage, latency, error_rate, skip, concurrency, verbose = False):
+    server = StandInServer(datasets, latency, error_rate).start()
+    # The server itself cannot be passed to the shard processes, only the URLs use_stand_in needs
+    urls = SimpleNamespace(all_tables_url=server.all_tables_url, table_url_base=server.table_url_base, api_url=server.api_url)
+    work_dir = tempfile.mkdtemp(prefix='osp_shards_')
+    start_dir = os.getcwd()
+    os.chdir(work_dir)
+    for output_dir in OUTPUT_DIRS:
+        os.makedirs(os.path.join('outputs', output_dir), exist_ok=True)
+
+    options = {'table_limit': datasets, 'sleep_time': 0, 'concurrency': concurrency}
+    if kind != 'tables':
+        options['storage'] = storage
+
+    try:
+        start = time.perf_counter()
+        processes = [multiprocessing.Process(target=run_shard, args=(kind, index, count, urls, options)) for index in range(1, count + 1) if index not in skip]
+        for process in processes:
+            process.start()
+        for process in processes:
+            process.join()
+        print('Crawled', datasets, 'data sets in', len(processes), 'shard processes in', round(time.perf_counter() - start, 2), 's with', server.requests, 'requests')
+
+        analyzer_class, read = KINDS[kind]
+        analyzer = analyzer_class(storage=storage) if kind != 'tables' else analyzer_class()
+        with contextlib.ExitStack() as stack:
+            if not verbose:
+                stack.enter_context(contextlib.redirect_stdout(stack.enter_context(open(os.devnull, 'w', encoding='utf-8'))))
+            missing, duplicates = analyzer.merge_shards(count)
+        print('Merged:', len(missing), 'missing,', len(duplicates), 'duplicates')
+        return missing, duplicates
+    finally:
+        os.chdir(start_dir)
+        shutil.rmtree(work_dir, ignore_errors=True)
+        server.stop()
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Run a sharded crawl against the local stand-in server and merge it')
+    parser.add_argument('kind', choices=list(KINDS))
+    parser.add_argument('--datasets', type=int, default=1000)
+    parser.add_argument('--shards', type=int, default=4)
+    parser.add_argument('--storage', choices=['files', 'pack'], default='files')
+    parser.add_argument('--latency', type=float, default=0.01, help='seconds the stand-in adds to every response')
+    parser.add_argument('--error-rate', type=float, default=0, help='share of requests the stand-in answers with 503')
+    parser.add_argument('--skip', type=int, nargs='*', default=[], help='shards not to run, to see how the merge reports them')
+    parser.add_argument('--concurrency', type=int, default=4, help='download threads per shard')
+    parser.add_argument('--verbose', action='store_true', help='show the output of the merge')
+    args = parser.parse_args()
+
+    missing, duplicates = run_shards(args.kind, args.datasets, args.shards, args.storage, args.latency, args.error_rate, args.skip, args.concurrency, args.verbose)
+    sys.exit(1 if missing or duplicates else 0)
@@ -0,0 +1,251 @@
+import json
+import time
+import random
+import hashlib
+import argparse
+import threading
+from datetime import date, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit
+
+# Synthetic data sets are grouped like the portal's in three category levels: every first level category has
+# 5 subcategories, these have 10 subcategories each, and every 3rd level category holds 10 tables
+SUBCATEGORIES = 5
+GROUPS = 10
+TABLES_PER_CATEGORY = 10
+SECTION_TITLES = ['Kontaktinformācija', 'Statistikas nozare', 'Statistiskā informācija', 'Datu apstrāde', 'Kvalitāte', 'Izplatīšana']
+SUBSECTION_TITLES = ['Apraksts', 'Klasifikācijas', 'Vienības', 'Periodiskums', 'Avoti']
+LATEST_UPDATE = date(2024, 1, 1)
+
+# Local stand-in for data.stat.gov.lv: the flat table listing, the pxweb table pages, the metadata pages
+# and the PxWeb API used through pyscbwrapper, all generated from the data set index.
+# latency is added to every response, error_rate is the share of requests answered with 503.
+class StandInServer:
+
+    def __init__(self, datasets = 100, latency = 0, error_rate = 0, page_size = 30000, port = 0, seed = 0):
+        self.datasets = datasets
+        self.latency = latency
+        self.error_rate = error_rate
+        self.page_size = page_size
+        self.seed = seed
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.errors = 0
+
+        self.tables = [self.make_table(index) for index in range(datasets)]
+        self.tables_by_id = {table['id']: index for index, table in enumerate(self.tables)}
+
+        # Category ids leading to a listing -> the nodes listed in it
+        self.children = {}
+        for table in self.tables:
+            ids = table['path'].strip('/').split('/')
+            for depth in range(3):
+                self.children.setdefault(tuple(ids[:depth]), {}).setdefault(ids[depth], {'id': ids[depth], 'type': 'l', 'text': ids[depth]})
+            self.children.setdefault(tuple(ids), {})[table['id']] = {'id': table['id'], 'type': 't', 'text': table['title'], 'updated': table['updated']}
+
+        server = self
+        class Handler(StandInHandler):
+            stand_in = server
+        self.httpd = ThreadingHTTPServer(('127.0.0.1', port), Handler)
+        self.httpd.daemon_threads = True
+        self.thread = None
+
+    @property
+    def base_url(self):
+        return 'http://127.0.0.1:%d' % self.httpd.server_port
+
+    # The URLs to use instead of the analyzers' ALL_TABLES_URL and TABLE_URL_BASE, and the PxWeb API base URL
+    @property
+    def all_tables_url(self):
+        return self.base_url + '/api/v1/lv/OSP_PUB?query=*&filter=*'
+
+    @property
+    def table_url_base(self):
+        return self.base_url + '/pxweb/lv/OSP_PUB/START__'
+
+    @property
+    def api_url(self):
+        return self.base_url + '/api/v1/en/OSP_PUB/'
+
+    def start(self):
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    # Category ids of the table, e.g. ['C1', 'C1S3', 'C1S3G7'], and its table id
+    def get_ids(self, index):
+        category = index // TABLES_PER_CATEGORY
+        group = category % GROUPS
+        subcategory = category // GROUPS % SUBCATEGORIES
+        top = category // (GROUPS * SUBCATEGORIES)
+        cat1 = 'C%d' % top
+        cat2 = cat1 + 'S%d' % subcategory
+        cat3 = cat2 + 'G%d' % group
+        return [cat1, cat2, cat3], 'TAB%06d' % index
+
+    def make_table(self, index):
+        categories, table_id = self.get_ids(index)
+        updated = LATEST_UPDATE - timedelta(days=(index * 7919 + self.seed) % 1500)
+        return {
+            'id': table_id,
+            'label': 'Tabula ' + table_id,
+            'title': 'Tabula ' + table_id,
+            'path': '/' + '/'.join(categories) + '/',
+            'updated': updated.isoformat() + 'T08:00:00',
+            'date': updated,
+        }
+
+    def listing(self):
+        return [{key: value for key, value in table.items() if key != 'date'} for table in self.tables]
+
+    def table_page(self, index):
+        table = self.tables[index]
+        body = ('<html><head><title>' + table['title'] + '</title></head><body>'
+                '<div class="information"><div class="information_lastupdated">Pēdējo reizi atjaunināts'
+                '<div class="information_lastupdated_value"> ' + table['date'].strftime('%d.%m.%Y') + ' </div></div></div>'
+                '<nav><a href="/">Sākums</a><a href="' + self.base_url + '/metadata/' + table['id'] + '">Metadati</a></nav>')
+        return self.pad(body, index) + '</body></html>'
+
+    def metadata_page(self, index):
+        generator = random.Random(self.seed * 1000003 + index)
+        parts = ['<html><body><main>']
+        for section_title in SECTION_TITLES:
+            # Some pages lack a section or leave it (almost) empty, like the real ones
+            chance = generator.random()
+            if chance < 0.05:
+                continue
+            parts.append('<h2>' + section_title + '</h2>')
+            parts.append('<p>' + ('x' * (generator.randint(0, 80) if chance < 0.15 else generator.randint(100, 2000))) + '</p>')
+            for subsection_title in generator.sample(SUBSECTION_TITLES, generator.randint(0, len(SUBSECTION_TITLES))):
+                parts.append('<h3>' + subsection_title + '</h3>')
+                parts.append('<p>' + 'y' * generator.randint(0, 400) + '</p>')
+        parts.append('</main><footer><h2>Kontakti</h2><p>Oficiālās statistikas portāls</p></footer>')
+        return self.pad(''.join(parts), index) + '</body></html>'
+
+    # Pads the page with markup the analyzers do not look at, up to page_size characters
+    def pad(self, body, index):
+        filler = '<div class="filler">' + ('Lorem ipsum %d ' % index) * 8 + '</div>'
+        missing = self.page_size - len(body)
+        if missing > 0:
+            body += (filler * (missing // len(filler) + 1))[:missing]
+        return body
+
+    # Answers the PxWeb API: category listings for up to 3 ids, the table metadata for 4 ids
+    def api_response(self, ids):
+        if len(ids) == 4:
+            index = self.tables_by_id.get(ids[3])
+            if index is None:
+                return None
+            table = self.tables[index]
+            return {
+                'columns': [],
+                'comments': [],
+                'data': [],
+                'metadata': [{
+                    'infofile': 'https://stat.gov.lv/' + table['id'] if index % 7 else '',
+                    'updated': table['updated'],
+                    'label': table['label'] + ' pēc gada un reģiona' * (index % 5),
+                    'source': 'Centrālā statistikas pārvalde',
+                }],
+            }
+
+        children = self.children.get(tuple(ids))
+        return list(children.values()) if children else None
+
+    # Returns the status code, content type and body for the path
+    def respond(self, path):
+        url = urlsplit(path)
+        segments = [segment for segment in url.path.split('/') if segment]
+
+        if url.path.rstrip('/') == '/api/v1/lv/OSP_PUB':
+            return 200, 'application/json', json.dumps(self.listing(), ensure_ascii=False)
+
+        if segments[:4] == ['api', 'v1', 'en', 'OSP_PUB']:
+            response = self.api_response(segments[4:])
+            if response is None:
+                return 404, 'application/json', '{"error": "not found"}'
+            return 200, 'application/json', json.dumps(response, ensure_ascii=False)
+
+        if segments[:3] == ['pxweb', 'lv', 'OSP_PUB'] and len(segments) == 5:
+            index = self.tables_by_id.get(segments[4])
+            if index is not None:
+                return 200, 'text/html; charset=utf-8', self.table_page(index)
+
+        if segments[:1] == ['metadata'] and len(segments) == 2:
+            index = self.tables_by_id.get(segments[1])
+            if index is not None:
+                return 200, 'text/html; charset=utf-8', self.metadata_page(index)
+
+        return 404, 'text/html; charset=utf-8', '<html><body>Not found</body></html>'
+
+    def should_fail(self):
+        if not self.error_rate:
+            return False
+        with self.lock:
+            return self.random.random() < self.error_rate
+
+class StandInHandler(BaseHTTPRequestHandler):
+
+    stand_in = None
+    protocol_version = 'HTTP/1.1' # Keep-alive, like the real portal
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        self.answer()
+
+    # pyscbwrapper posts its (empty) query to the API
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        self.rfile.read(length)
+        self.answer()
+
+    def answer(self):
+        stand_in = self.stand_in
+        with stand_in.lock:
+            stand_in.requests += 1
+        if stand_in.latency:
+            time.sleep(stand_in.latency)
+
+        if stand_in.should_fail():
+            with stand_in.lock:
+                stand_in.errors += 1
+            self.send(503, 'text/html; charset=utf-8', b'<html><body>Service unavailable</body></html>', {'Retry-After': '1'})
+            return
+
+        status, content_type, body = stand_in.respond(self.path)
+        body = body.encode('utf-8')
+        etag = '"' + hashlib.sha1(body).hexdigest() + '"'
+        if status == 200 and self.headers.get('If-None-Match') == etag:
+            self.send(304, content_type, b'', {'ETag': etag})
+            return
+        self.send(status, content_type, body, {'ETag': etag} if status == 200 else {})
+
+    def send(self, status, content_type, body, headers):
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Serve synthetic OSP data sets on a local port')
+    parser.add_argument('--datasets', type=int, default=1000)
+    parser.add_argument('--port', type=int, default=8000)
+    parser.add_argument('--latency', type=float, default=0, help='seconds added to every response')
+    parser.add_argument('--error-rate', type=float, default=0, help='share of requests answered with 503')
+    parser.add_argument('--page-size', type=int, default=30000, help='size of the HTML pages in characters')
+    args = parser.parse_args()
+
+    server = StandInServer(args.datasets, args.latency, args.error_rate, args.page_size, args.port)
+    print('Serving', args.datasets, 'data sets at', server.base_url)
+    print('Table listing:', server.all_tables_url)
+    server.httpd.serve_forever()
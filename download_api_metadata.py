@@ -1,4 +1,8 @@
 from Modules.osp_api_analyzer import OspApiAnalyzer
+from Modules.osp_cli import parse_download_args
 
-ospApiAnalyzer = OspApiAnalyzer(table_limit = 1000000, sleep_time=1)
-ospApiAnalyzer.read_tables_from_api()
\ No newline at end of file
+args = parse_download_args('Download the OSP table metadata from the API', pages = False)
+
+ospApiAnalyzer = OspApiAnalyzer(table_limit = 1000000, concurrency = 4, requests_per_second = 2, shard = args.shard)
+# The flat table listing saves walking the category tree, see validate_api_listing.py
+ospApiAnalyzer.read_tables_from_listing(only_failed = args.retry_failed)
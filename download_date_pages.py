@@ -1,4 +1,8 @@
 from Modules.osp_date_analyzer import OspDateAnalyzer
+from Modules.osp_cli import parse_download_args
 
-ospGuiAnalyzer = OspDateAnalyzer(table_limit = 100000, sleep_time = 1)
-ospGuiAnalyzer.read_date_pages()
\ No newline at end of file
+if __name__ == '__main__':
+    args = parse_download_args('Download the OSP data set pages')
+
+    ospGuiAnalyzer = OspDateAnalyzer(table_limit = 100000, concurrency = 8, requests_per_second = 5, storage = args.storage, shard = args.shard)
+    ospGuiAnalyzer.read_date_pages(only_failed = args.retry_failed, analyze = args.analyze, keep_html = args.keep_html)
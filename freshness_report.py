@@ -0,0 +1,42 @@
+import argparse
+from datetime import datetime, timedelta
+
+from Modules.osp_freshness import OspFreshnessIndex, STALE_WEEKS
+
+parser = argparse.ArgumentParser(description='Report on the freshness index that analyze_date_pages.py keeps up to date')
+parser.add_argument('--days', type=int, default=7, help='compare the latest snapshot with the last one taken this many days earlier')
+parser.add_argument('--since', type=int, default=None, help='snapshot to compare with instead, see --snapshots')
+parser.add_argument('--weeks', type=int, default=STALE_WEEKS, help='weeks without an update after which a data set is stale')
+parser.add_argument('--top', type=int, default=20, help='number of the oldest data sets to list')
+parser.add_argument('--snapshots', action='store_true', help='list the snapshots')
+args = parser.parse_args()
+
+freshness = OspFreshnessIndex()
+latest = freshness.latest_snapshot()
+if latest is None:
+    print('The freshness index is empty, run analyze_date_pages.py first')
+    raise SystemExit(1)
+
+if args.snapshots:
+    for snapshot, taken_at in freshness.snapshots():
+        print('Snapshot', snapshot, 'taken at', taken_at)
+
+print('Data sets by weeks since the last update:')
+for bucket, count in freshness.staleness_buckets().items():
+    print('  %-10s %8d' % (bucket, count))
+
+print(args.top, 'data sets updated longest ago:')
+for dataset, updated in freshness.oldest(args.top):
+    print('  ', updated, dataset)
+
+since = args.since if args.since is not None else freshness.snapshot_before(datetime.now() - timedelta(days=args.days))
+if since is None:
+    print('No snapshot is older than', args.days, 'days yet')
+else:
+    newly_stale, refreshed = freshness.changes_between(since, latest, args.weeks)
+    print('Since snapshot', since, ':', len(newly_stale), 'data sets became stale,', len(refreshed), 'were updated')
+    for dataset, updated in newly_stale:
+        print('  Stale:', dataset, 'last updated', updated)
+    for dataset, previous, updated in refreshed:
+        print('  Updated:', dataset, previous, '->', updated)
+freshness.close()
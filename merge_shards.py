@@ -0,0 +1,23 @@
+import sys
+import argparse
+
+from Modules.osp_page_store import STORAGE_MODES, DEFAULT_STORAGE
+from Modules.osp_date_analyzer import OspDateAnalyzer
+from Modules.osp_gui_analyzer import OspGuiAnalyzer
+from Modules.osp_api_analyzer import OspApiAnalyzer
+
+parser = argparse.ArgumentParser(description='Combine the outputs of a crawl that ran as N shards (download_*.py --shard k/N) into one corpus')
+parser.add_argument('kind', choices=['dataset', 'metadata', 'tables'], help='data set pages, metadata pages or API tables')
+parser.add_argument('shards', type=int, help='number of shards N')
+parser.add_argument('--storage', choices=STORAGE_MODES, default=DEFAULT_STORAGE, help='storage of the merged pages (default from OSP_PAGE_STORAGE)')
+args = parser.parse_args()
+
+if args.kind == 'dataset':
+    missing, duplicates = OspDateAnalyzer(storage = args.storage).merge_shards(args.shards)
+elif args.kind == 'metadata':
+    missing, duplicates = OspGuiAnalyzer(storage = args.storage).merge_shards(args.shards)
+else:
+    missing, duplicates = OspApiAnalyzer().merge_shards(args.shards)
+
+# A non-zero exit status tells scripts that the corpus is incomplete
+sys.exit(1 if missing or duplicates else 0)
@@ -0,0 +1,4 @@
+from Modules.osp_api_analyzer import OspApiAnalyzer
+
+ospApiAnalyzer = OspApiAnalyzer()
+ospApiAnalyzer.migrate_tables_dir()
@@ -0,0 +1,24 @@
+import argparse
+
+from Modules.osp_page_store import OspPagePack
+from Modules.osp_date_analyzer import DATASET_HTML_DIR, DATASET_PACK_DIR
+from Modules.osp_gui_analyzer import METADATA_HTML_DIR, METADATA_PACK_DIR
+
+PAGE_KINDS = {
+    'dataset': (DATASET_HTML_DIR, DATASET_PACK_DIR),
+    'metadata': (METADATA_HTML_DIR, METADATA_PACK_DIR),
+}
+
+parser = argparse.ArgumentParser(description='Move saved pages between loose .html files and the pack file used with storage="pack"')
+parser.add_argument('action', choices=['import', 'export'], help='import loose files into the pack, or export the pack as loose files')
+parser.add_argument('kind', choices=list(PAGE_KINDS), help='data set pages or metadata pages')
+parser.add_argument('--directory', default=None, help='directory of the loose files, defaults to the one the analyzer uses')
+args = parser.parse_args()
+
+html_dir, pack_dir = PAGE_KINDS[args.kind]
+pack = OspPagePack(pack_dir)
+if args.action == 'import':
+    pack.import_directory(args.directory or html_dir)
+else:
+    pack.export_directory(args.directory or html_dir)
+pack.close()
@@ -0,0 +1,4 @@
+from Modules.osp_api_analyzer import OspApiAnalyzer
+
+ospApiAnalyzer = OspApiAnalyzer(concurrency = 4, requests_per_second = 2)
+ospApiAnalyzer.validate_table_listing()
@@ -0,0 +1,5 @@
+from Modules.osp_date_analyzer import OspDateAnalyzer
+
+if __name__ == '__main__':
+    ospGuiAnalyzer = OspDateAnalyzer()
+    ospGuiAnalyzer.validate_date_extraction()